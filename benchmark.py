@@ -0,0 +1,588 @@
+# -*- coding: utf-8 -*-
+# @File          : benchmark.py
+# @Description   : Aliyun-DDNS 性能基准测试, 用法参见 `python3 benchmark.py -h`
+
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import yaml
+
+
+def timeit(func, repeat: int) -> float:
+    """返回单次调用平均耗时, 单位毫秒"""
+    func()  # 预热
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def make_describe_response(count: int):
+    """构造包含 count 条记录的 DescribeDomainRecords 响应"""
+    from alibabacloud_alidns20150109 import models as alidns_20150109_models
+
+    return alidns_20150109_models.DescribeDomainRecordsResponse().from_map(
+        {
+            "headers": {"content-type": "application/json"},
+            "statusCode": 200,
+            "body": {
+                "RequestId": "00000000-0000-0000-0000-000000000000",
+                "TotalCount": count,
+                "PageNumber": 1,
+                "PageSize": count,
+                "DomainRecords": {
+                    "Record": [
+                        {
+                            "DomainName": "example.com",
+                            "RecordId": str(100000000 + i),
+                            "RR": f"host{i}",
+                            "Type": "A",
+                            "Value": f"10.0.{i // 256}.{i % 256}",
+                            "Line": "default",
+                            "TTL": 600,
+                            "Status": "ENABLE",
+                            "Locked": False,
+                            "Weight": 1,
+                        }
+                        for i in range(count)
+                    ]
+                },
+            },
+        }
+    )
+
+
+def bench_decode(args):
+    """SDK 响应解析: 序列化 + jsonpath 全树扫描 对比 直接字段读取"""
+    from main import decode_records
+
+    response = make_describe_response(args.records)
+
+    results = {"records": args.records}
+    results["typed_ms"] = timeit(lambda: decode_records(response), args.repeat)
+
+    try:
+        from alibabacloud_tea_util.client import Client as UtilClient
+        from jsonpath import jsonpath
+    except ImportError:
+        print("未安装 jsonpath, 跳过旧解析方式")
+    else:
+
+        def legacy():
+            response_json = json.loads(UtilClient.to_jsonstring(response))
+            return (
+                jsonpath(response_json, "$...Value"),
+                jsonpath(response_json, "$...RecordId"),
+            )
+
+        results["jsonpath_ms"] = timeit(legacy, args.repeat)
+        results["speedup"] = results["jsonpath_ms"] / results["typed_ms"]
+
+    print(json.dumps(results, indent=2))
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+class IpHandler(BaseHTTPRequestHandler):
+    """模拟公网IP检测链接, 返回 server.ip"""
+
+    protocol_version = "HTTP/1.1"
+    # 响应头与响应体分开写入, 避免 Nagle 与延迟确认叠加的 40ms 等待
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        data = f"{self.server.ip}\n".encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_ip_server(ip: str) -> ThreadingHTTPServer:
+    ip_server = ThreadingHTTPServer(("127.0.0.1", 0), IpHandler)
+    ip_server.daemon_threads = True
+    ip_server.ip = ip
+    threading.Thread(target=ip_server.serve_forever, daemon=True).start()
+    return ip_server
+
+
+def run_e2e(count: int, args) -> dict:
+    """在本地模拟API上运行 count 条记录的完整同步周期"""
+    import main as ddns
+    from mock_alidns import MockAlidns
+
+    mock = MockAlidns(
+        {"bench-ak": "bench-secret"},
+        latency=args.latency,
+        throttle_rate=args.throttle_rate,
+    )
+    records_config = {}
+    for i in range(count):
+        domain_name = f"d{i // args.per_domain}.example.com"
+        mock.add_record(domain_name, f"host{i}", "A", "192.0.2.1")
+        records_config.setdefault(domain_name, []).append(f"host{i}")
+    # 同一主机记录在其他线路上的记录, 更新后线路应保持不变
+    mock.add_record("d0.example.com", "host0", "A", "192.0.2.1", line="telecom")
+    endpoint = mock.start()
+
+    ip_server = start_ip_server("198.51.100.1")
+
+    work_dir = tempfile.TemporaryDirectory()
+    config = {
+        "public_ip": {
+            "urls": [f"http://127.0.0.1:{ip_server.server_port}/"],
+            "quorum": 1,
+        },
+        "account": {"access_key_id": "bench-ak", "access_key_secret": "bench-secret"},
+        "domain": {
+            "dns_end_point": endpoint,
+            "protocol": "HTTP",
+            "transport": args.transport,
+        },
+        "records": [
+            {"name": domain_name, "rr": rr_list, "type": "A"}
+            for domain_name, rr_list in records_config.items()
+        ]
+        + [{"name": "d0.example.com", "rr": "host0", "type": "A", "line": "telecom"}],
+        "state": {"file": str(Path(work_dir.name, "state.json")), "verify_ttl": 0},
+        "api": {
+            "qps": args.qps,
+            "concurrency": args.concurrency,
+            "backoff": 0.05,
+            "batch_threshold": args.batch_threshold,
+            "batch_type": args.batch_type,
+        },
+    }
+    config_file = Path(work_dir.name, "config.yml")
+    config_file.write_text(yaml.safe_dump(config), encoding="utf-8")
+
+    service = ddns.AliyunDDNS(["-c", str(config_file)])
+    ddns.logger.setLevel(logging.WARNING)
+
+    def cycle() -> float:
+        start = time.perf_counter()
+        service.run()
+        return time.perf_counter() - start
+
+    # 首次运行: 批量查询全部记录并全部更新
+    cold = cycle()
+    noop = [cycle() for _ in range(args.cycles)]
+    update = []
+    for i in range(args.cycles):
+        ip_server.ip = f"198.51.100.{2 + i % 200}"
+        update.append(cycle())
+
+    # 单独统计一次全部更新周期的内存分配峰值
+    ip_server.ip = "203.0.113.1"
+    tracemalloc.start()
+    cycle()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # 限流等原因重试耗尽的记录计入结果, 不中断测试
+    failed_records = sorted(
+        f"{record['RR']}.{record['DomainName']}/{record['Line']}"
+        for record in mock.records.values()
+        if record["Value"] != "203.0.113.1"
+    )
+    lines = sorted(record["Line"] for record in mock.records.values())
+
+    service.notifier.close()
+    mock.stop()
+    ip_server.shutdown()
+    work_dir.cleanup()
+    return {
+        "records": count,
+        "cold_cycle_s": round(cold, 4),
+        "noop_cycle_p50_ms": round(percentile(noop, 0.5) * 1000, 3),
+        "noop_cycle_p99_ms": round(percentile(noop, 0.99) * 1000, 3),
+        "update_cycle_p50_ms": round(percentile(update, 0.5) * 1000, 3),
+        "update_cycle_p99_ms": round(percentile(update, 0.99) * 1000, 3),
+        "records_per_s": round(len(service.records) * len(update) / sum(update), 1),
+        "update_cycle_alloc_peak_kb": peak // 1024,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "api_requests": mock.requests,
+        "failed_records": failed_records,
+        "lines_preserved": lines == sorted(["default"] * count + ["telecom"]),
+    }
+
+
+def bench_e2e(args):
+    """端到端同步周期: 本地模拟API上的记录吞吐、周期延迟及内存"""
+    for count in args.records:
+        print(json.dumps(run_e2e(count, args), indent=2), flush=True)
+
+
+def parse_importtime(stderr: str) -> list:
+    """解析 -X importtime 输出, 返回 [(模块, 累计耗时us, 是否顶层导入)]"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:") :].split("|")
+        # 以缩进表示嵌套层级, 顶层导入前只有一个空格
+        modules.append((name.strip(), int(cumulative_us), not name[1:].startswith(" ")))
+    return modules
+
+
+def run_process(command: list) -> tuple:
+    """运行子进程, 返回 (耗时秒, 最大常驻内存KB, 标准错误输出)"""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    stderr = process.stderr.read()
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"{command} 退出码 {process.returncode}\n{stderr}")
+    return elapsed, usage.ru_maxrss, stderr
+
+
+def bench_startup(args):
+    """定时执行入口: 无变更运行的进程耗时、内存及模块导入耗时"""
+    from mock_alidns import MockAlidns
+
+    mock = MockAlidns({"bench-ak": "bench-secret"})
+    mock.add_record("example.com", "www", "A", "192.0.2.1")
+    endpoint = mock.start()
+    ip_server = start_ip_server("198.51.100.1")
+
+    work_dir = tempfile.TemporaryDirectory()
+    config = {
+        "public_ip": {
+            "urls": [f"http://127.0.0.1:{ip_server.server_port}/"],
+            "quorum": 1,
+        },
+        "account": {"access_key_id": "bench-ak", "access_key_secret": "bench-secret"},
+        "domain": {"dns_end_point": endpoint, "protocol": "HTTP"},
+        "records": [{"name": "example.com", "rr": "www", "type": "A"}],
+        "state": {"file": str(Path(work_dir.name, "state.json"))},
+    }
+    config_file = Path(work_dir.name, "config.yml")
+    config_file.write_text(yaml.safe_dump(config), encoding="utf-8")
+    main_file = str(Path(__file__).with_name("main.py"))
+    command = [sys.executable, main_file, "-c", str(config_file)]
+
+    # 首次运行查询并更新远程记录, 之后均为无变更运行
+    run_process(command)
+    requests_before = dict(mock.requests)
+    runs = [run_process(command) for _ in range(args.repeat)]
+    api_requests = {
+        action: count - requests_before.get(action, 0)
+        for action, count in mock.requests.items()
+        if count != requests_before.get(action, 0)
+    }
+
+    _, _, stderr = run_process([sys.executable, "-X", "importtime"] + command[1:])
+    modules = parse_importtime(stderr)
+    top_level = sorted(
+        ((name, cumulative) for name, cumulative, top in modules if top),
+        key=lambda item: -item[1],
+    )
+
+    mock.stop()
+    ip_server.shutdown()
+    work_dir.cleanup()
+
+    elapsed = [run[0] for run in runs]
+    print(
+        json.dumps(
+            {
+                "runs": args.repeat,
+                "wall_p50_ms": round(percentile(elapsed, 0.5) * 1000, 1),
+                "wall_min_ms": round(min(elapsed) * 1000, 1),
+                "max_rss_kb": max(run[1] for run in runs),
+                "import_total_ms": round(sum(item[1] for item in top_level) / 1000, 1),
+                "sdk_loaded": any(
+                    name.startswith("alibabacloud_alidns20150109")
+                    for name, _, _ in modules
+                ),
+                "smtp_loaded": any(name == "smtplib" for name, _, _ in modules),
+                "api_requests": api_requests,
+                "slowest_imports_ms": {
+                    name: round(cumulative / 1000, 1)
+                    for name, cumulative in top_level[: args.top]
+                },
+            },
+            indent=2,
+        )
+    )
+
+
+# 固定时间及 nonce 的签名测试向量, 签名由 Utils.get_authorization 生成
+SIGN_USER_AGENT = "AlibabaCloud (Linux; x86_64) Python/3.12.0 Core/0.3.0 TeaDSL/1"
+SIGN_VECTORS = [
+    {
+        "access_key_id": "ak",
+        "access_key_secret": "sk",
+        "end_point": "alidns.cn-shenzhen.aliyuncs.com",
+        "action": "DescribeDomainRecords",
+        "query": {
+            "DomainName": "example.com",
+            "RRKeyWord": "www",
+            "PageNumber": "1",
+            "PageSize": "500",
+        },
+        "date": "2024-05-28T14:01:00Z",
+        "nonce": "3f1c8e2a-5b7d-5c9e-8f0a-1b2c3d4e5f60",
+        "signature": "c2b48469e232146462f49b0e7c14174885019e5a74f25b151ed806ddf1aae0b4",
+    },
+    {
+        "access_key_id": "LTAI5tExample",
+        "access_key_secret": "secret/with+chars=",
+        "end_point": "127.0.0.1:8080",
+        "action": "UpdateDomainRecord",
+        "query": {
+            "RR": "@",
+            "RecordId": "1234567890",
+            "Type": "AAAA",
+            "Value": "2001:db8::1",
+            "Line": "中国电信",
+        },
+        "date": "2026-01-01T00:00:00Z",
+        "nonce": "00000000-0000-5000-8000-000000000000",
+        "signature": "2f484ecaae97cdd4049e28b2e204fd5f708fe0c73a448a7b87f3b2aa2308985f",
+    },
+]
+
+
+def legacy_sign(
+    utils,
+    access_key_id: str,
+    access_key_secret: str,
+    end_point: str,
+    action: str,
+    query: dict,
+    user_agent: str = None,
+    date: str = None,
+    nonce: str = None,
+) -> dict:
+    """每次请求构造全部请求头并经 Utils.get_authorization 规范化及签名, 返回请求头"""
+    from slim import Request
+
+    payload = utils.hex_encode(utils.hash_bytes(b"", utils.signature_algorithm))
+    request = Request()
+    request.query = query
+    request.headers = {
+        "accept": "application/json",
+        "host": end_point,
+        "user-agent": user_agent or utils.get_agent(),
+        "x-acs-action": action,
+        "x-acs-content-sha256": payload,
+        "x-acs-date": date or utils.get_timestamp(utc=True),
+        "x-acs-signature-nonce": nonce or utils.get_nonce(),
+        "x-acs-version": utils.acs_version,
+    }
+    request.headers["Authorization"] = utils.get_authorization(
+        request, utils.signature_algorithm, payload, access_key_id, access_key_secret
+    )
+    return request.headers
+
+
+def bench_sign(args):
+    """请求签名: 校验测试向量, 输出 Signer 与 Utils.get_authorization 每秒签名数"""
+    from slim import Signer, Utils
+
+    utils = Utils()
+    for vector in SIGN_VECTORS:
+        credentials = (
+            vector["access_key_id"],
+            vector["access_key_secret"],
+            vector["end_point"],
+        )
+        expected = legacy_sign(
+            utils,
+            *credentials,
+            vector["action"],
+            vector["query"],
+            SIGN_USER_AGENT,
+            vector["date"],
+            vector["nonce"],
+        )
+        headers = Signer(*credentials, user_agent=SIGN_USER_AGENT).sign(
+            vector["action"],
+            utils.get_canonical_query_string(vector["query"]),
+            vector["date"],
+            vector["nonce"],
+        )
+        signature = f"Signature={vector['signature']}"
+        if headers != expected or not headers["Authorization"].endswith(signature):
+            raise SystemExit(
+                f"{vector['action']} 签名与测试向量不一致\n{expected}\n{headers}"
+            )
+
+    vector = SIGN_VECTORS[0]
+    credentials = (vector["access_key_id"], vector["access_key_secret"], vector["end_point"])
+    signer = Signer(*credentials)
+    legacy_ms = timeit(
+        lambda: legacy_sign(utils, *credentials, vector["action"], vector["query"]),
+        args.repeat,
+    )
+    signer_ms = timeit(
+        lambda: signer.sign(
+            vector["action"], utils.get_canonical_query_string(vector["query"])
+        ),
+        args.repeat,
+    )
+    print(
+        json.dumps(
+            {
+                "vectors": len(SIGN_VECTORS),
+                "legacy_per_second": round(1000 / legacy_ms),
+                "signer_per_second": round(1000 / signer_ms),
+                "speedup": round(legacy_ms / signer_ms, 2),
+            },
+            indent=2,
+        )
+    )
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """模拟 webhook 接收端, 记录请求体, 前 server.failures 次请求返回 503"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests.append(json.loads(body))
+        status = 503 if len(self.server.requests) <= self.server.failures else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def bench_notify(args):
+    """通知后端: 在本地 HTTP 服务上校验 webhook 载荷及重试, 校验文件后端的 JSON Lines 输出"""
+    import main as ddns
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), WebhookHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/ddns"
+    work_dir = tempfile.TemporaryDirectory()
+    events_path = Path(work_dir.name, "events.jsonl")
+    retries = 3
+
+    def run(failures: int) -> tuple:
+        """发送 args.events 条通知, 返回 (webhook 收到的请求, 文件中的通知, 耗时)"""
+        server.requests, server.failures = [], failures
+        events_path.unlink(missing_ok=True)
+        notifier = ddns.NotificationQueue(
+            {
+                "hook": ddns.WebhookNotifier(
+                    "hook", {"url": url, "retries": retries, "backoff": 0.01}
+                ),
+                "events": ddns.FileNotifier("events", {"path": str(events_path)}),
+            },
+            digest_window=0.2,
+        )
+        start = time.perf_counter()
+        for i in range(args.events):
+            notifier.notify("[PASS]UpdateDomainRecord", f"host{i}", record=f"host{i}")
+        notifier.close()
+        elapsed = time.perf_counter() - start
+        lines = events_path.read_text(encoding="utf-8").splitlines()
+        return server.requests, [json.loads(line) for line in lines], elapsed
+
+    def check(condition: bool, message: str):
+        if not condition:
+            raise SystemExit(message)
+
+    results = {"events": args.events}
+    ddns.logger.setLevel(logging.CRITICAL)
+    # 通知在合并窗口内发出, 每次请求为同一批全部通知
+    for failures in (0, 2, retries + 1):
+        requests, written, elapsed = run(failures)
+        attempts = min(failures + 1, retries + 1)
+        check(
+            len(requests) == attempts,
+            f"服务端失败 {failures} 次时 webhook 请求 {len(requests)} 次, 预期 {attempts} 次",
+        )
+        for body in requests:
+            check(
+                [event["record"] for event in body["events"]]
+                == [f"host{i}" for i in range(args.events)],
+                f"webhook 载荷不正确: {body}",
+            )
+        check(
+            [event["message"] for event in written] == [f"host{i}" for i in range(args.events)]
+            and all(event["header"] == "[PASS]UpdateDomainRecord" for event in written),
+            f"文件后端输出不正确: {written}",
+        )
+        results[f"failures_{failures}"] = {"requests": len(requests), "seconds": round(elapsed, 3)}
+
+    server.shutdown()
+    work_dir.cleanup()
+    print(json.dumps(results, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aliyun-DDNS benchmark")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    decode_parser = subparsers.add_parser("decode", help=bench_decode.__doc__)
+    decode_parser.add_argument("--records", "-n", type=int, default=500)
+    decode_parser.add_argument("--repeat", "-r", type=int, default=20)
+    decode_parser.set_defaults(func=bench_decode)
+
+    e2e_parser = subparsers.add_parser("e2e", help=bench_e2e.__doc__)
+    e2e_parser.add_argument(
+        "--records", "-n", type=int, nargs="+", default=[1, 100, 10000]
+    )
+    e2e_parser.add_argument("--cycles", "-c", type=int, default=3)
+    e2e_parser.add_argument("--per_domain", type=int, default=1000, help="每个域名的记录数")
+    e2e_parser.add_argument("--concurrency", type=int, default=8)
+    e2e_parser.add_argument("--qps", type=float, default=0, help="客户端限流, 0 为不限流")
+    e2e_parser.add_argument("--latency", type=float, default=0, help="模拟API附加延迟, 单位秒")
+    e2e_parser.add_argument("--throttle_rate", type=float, default=0, help="模拟API随机限流概率")
+    e2e_parser.add_argument("--transport", choices=["sdk", "slim"], default="sdk")
+    e2e_parser.add_argument(
+        "--batch_threshold", type=int, default=0, help="同一域名变更数达到该值时批量更新, 0 为逐条更新"
+    )
+    e2e_parser.add_argument(
+        "--batch_type",
+        default=None,
+        help="批量更新的操作类型, 模拟API只接受文档中的 RR_ADD / RR_DEL, 其他类型用于验证逐条更新回退",
+    )
+    e2e_parser.set_defaults(func=bench_e2e)
+
+    startup_parser = subparsers.add_parser("startup", help=bench_startup.__doc__)
+    startup_parser.add_argument("--repeat", "-r", type=int, default=10)
+    startup_parser.add_argument("--top", type=int, default=10, help="输出耗时最多的顶层导入数")
+    startup_parser.set_defaults(func=bench_startup)
+
+    sign_parser = subparsers.add_parser("sign", help=bench_sign.__doc__)
+    sign_parser.add_argument("--repeat", "-r", type=int, default=20000)
+    sign_parser.set_defaults(func=bench_sign)
+
+    notify_parser = subparsers.add_parser("notify", help=bench_notify.__doc__)
+    notify_parser.add_argument("--events", "-n", type=int, default=20)
+    notify_parser.set_defaults(func=bench_notify)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
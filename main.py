@@ -1,20 +1,37 @@
 import argparse
+import contextlib
+import contextvars
+import errno
+import functools
+import ipaddress
 import json
 import logging
+import os
+import queue
 import random
-import smtplib
-from email.header import Header
-from email.mime.text import MIMEText
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from urllib.parse import urlsplit
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 import requests
 import yaml
-from alibabacloud_alidns20150109 import models as alidns_20150109_models
-from alibabacloud_alidns20150109.client import Client as Alidns20150109Client
-from alibabacloud_tea_openapi import models as open_api_models
-from alibabacloud_tea_util import models as util_models
-from alibabacloud_tea_util.client import Client as UtilClient
-from jsonpath import jsonpath
+from urllib3.util.retry import Retry
+
+# 阿里云SDK及smtplib导入耗时较长, 仅在调用API、发送邮件时导入,
+# 定时执行时多数运行IP未变化, 无需加载
 
 logger = logging.getLogger(__name__)
 
@@ -24,10 +41,1346 @@ console_handler.setFormatter(formatter)
 
 logger.addHandler(console_handler)
 
+# 日志上下文: 每次运行的周期ID及正在处理的记录, 由 LogContextFilter 附加到每条日志
+LOG_CONTEXT = {
+    "cycle": contextvars.ContextVar("cycle", default=None),
+    "record": contextvars.ContextVar("record", default=None),
+}
 
-class AliyunDDNS:
+
+@contextlib.contextmanager
+def log_context(**fields):
+    """该范围内输出的日志附加 fields(cycle / record)"""
+    tokens = [(LOG_CONTEXT[name], LOG_CONTEXT[name].set(value)) for name, value in fields.items()]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def log_cycle(func):
+    """每次调用为一个周期, 期间的日志附加新的周期ID"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with log_context(cycle=os.urandom(4).hex()):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def in_log_context(func):
+    """
+    线程池及子线程不继承 contextvars, 返回在调用方日志上下文中执行 func 的函数
+    每次调用使用上下文的副本, 可在多个线程中并发执行
+    """
+    context = contextvars.copy_context()
+    return lambda *args: context.copy().run(func, *args)
+
+
+class LogContextFilter(logging.Filter):
+    """在记录日志的线程中读取日志上下文, 队列模式下由后台线程输出时仍保留"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for name, var in LOG_CONTEXT.items():
+            setattr(record, name, var.get())
+        return True
+
+
+logger.addFilter(LogContextFilter())
+
+
+class JsonFormatter(logging.Formatter):
+    """每行一个 JSON 对象: time, level, message 及日志上下文"""
 
     def __init__(self):
+        super().__init__()
+        # 同一秒内的日志复用格式化的时间, 避免每行调用 strftime
+        self.cached_time = (None, "", "")
+
+    def format_time(self, created: float) -> str:
+        second = int(created)
+        cached_second, prefix, zone = self.cached_time
+        if second != cached_second:
+            local = time.localtime(second)
+            prefix = time.strftime("%Y-%m-%dT%H:%M:%S", local)
+            zone = time.strftime("%z", local)
+            self.cached_time = (second, prefix, zone)
+        return f"{prefix}.{int((created - second) * 1000):03d}{zone}"
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.format_time(record.created),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        for name in LOG_CONTEXT:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+LOG_FORMATTERS = {
+    "text": lambda: formatter,
+    "json": JsonFormatter,
+}
+
+log_listener = None
+
+
+def configure_logging(log_config: dict):
+    """
+    按 logging 配置设置日志格式
+    queue 为 true 时日志放入无界队列, 由后台线程写出, 输出阻塞时不影响检查及更新
+    """
+    global log_listener
+    log_format = log_config.get("format", "text")
+    if log_format not in LOG_FORMATTERS:
+        logger.error("未知的 logging.format %s, 使用 text", log_format)
+        log_format = "text"
+    console_handler.setFormatter(LOG_FORMATTERS[log_format]())
+    previous_listener, log_listener = log_listener, None
+    handler = console_handler
+    if log_config.get("queue", False):
+        from logging.handlers import QueueHandler, QueueListener
+
+        log_queue = queue.SimpleQueue()
+        log_listener = QueueListener(log_queue, console_handler)
+        log_listener.start()
+        handler = QueueHandler(log_queue)
+    for previous_handler in list(logger.handlers):
+        logger.removeHandler(previous_handler)
+    logger.addHandler(handler)
+    # 切换后再停止原后台线程, 写出其队列中剩余的日志
+    if previous_listener is not None:
+        previous_listener.stop()
+
+
+def close_logging():
+    """写出队列中剩余的日志并停止后台线程"""
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
+
+# rtnetlink, 参见 linux/rtnetlink.h linux/if_addr.h
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_F_TEMPORARY = 0x01
+IFA_F_DEPRECATED = 0x20
+IFA_F_TENTATIVE = 0x40
+
+NLMSG_HEADER = struct.Struct("=LHHLL")
+IFADDRMSG = struct.Struct("=BBBBI")
+RTATTR = struct.Struct("=HH")
+
+
+def parse_addr_messages(data: bytes):
+    """
+    解析 RTM_NEWADDR / RTM_DELADDR 消息
+    逐条返回 (消息类型, 网卡序号, 地址, ifa_flags), 遇到 NLMSG_DONE 时返回 (NLMSG_DONE, ...)
+    """
+    offset = 0
+    while offset + NLMSG_HEADER.size <= len(data):
+        msg_len, msg_type, _, _, _ = NLMSG_HEADER.unpack_from(data, offset)
+        if msg_len < NLMSG_HEADER.size:
+            break
+        if msg_type in (NLMSG_DONE, NLMSG_ERROR):
+            yield msg_type, None, None, 0
+        elif msg_type in (RTM_NEWADDR, RTM_DELADDR):
+            body = offset + NLMSG_HEADER.size
+            family, _, flags, _, index = IFADDRMSG.unpack_from(data, body)
+            attrs = {}
+            attr_offset = body + IFADDRMSG.size
+            while attr_offset + RTATTR.size <= offset + msg_len:
+                attr_len, attr_type = RTATTR.unpack_from(data, attr_offset)
+                if attr_len < RTATTR.size:
+                    break
+                attrs[attr_type] = data[attr_offset + RTATTR.size : attr_offset + attr_len]
+                attr_offset += (attr_len + 3) & ~3
+            # 点对点链路(PPPoE)中 IFA_LOCAL 为本端地址, IFA_ADDRESS 为对端地址
+            raw = attrs.get(IFA_LOCAL, attrs.get(IFA_ADDRESS))
+            if raw is not None:
+                yield msg_type, index, socket.inet_ntop(family, raw), flags
+        offset += (msg_len + 3) & ~3
+
+
+def netlink_addresses(index: int) -> list:
+    """通过 rtnetlink 读取网卡地址, 返回 [(地址, ifa_flags)]"""
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE) as sock:
+        sock.settimeout(1)
+        request = IFADDRMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        header = NLMSG_HEADER.pack(
+            NLMSG_HEADER.size + len(request), RTM_GETADDR, NLM_F_REQUEST | NLM_F_DUMP, 1, 0
+        )
+        sock.sendto(header + request, (0, 0))
+        addresses = []
+        while True:
+            for msg_type, msg_index, address, flags in parse_addr_messages(
+                sock.recv(65536)
+            ):
+                if msg_type in (NLMSG_DONE, NLMSG_ERROR):
+                    return addresses
+                if msg_index == index:
+                    addresses.append((address, flags))
+
+
+def ip_command_addresses(interface: str) -> list:
+    """通过 ip addr 读取网卡地址, 返回 [(地址, ifa_flags)]"""
+    output = subprocess.run(
+        ["ip", "-o", "addr", "show", "dev", interface],
+        capture_output=True,
+        text=True,
+        timeout=2,
+        check=True,
+    ).stdout
+    addresses = []
+    for line in output.splitlines():
+        fields = line.split()
+        for family in ("inet", "inet6"):
+            if family in fields:
+                address = fields[fields.index(family) + 1].split("/")[0]
+                flags = 0
+                if "temporary" in fields:
+                    flags |= IFA_F_TEMPORARY
+                if "deprecated" in fields:
+                    flags |= IFA_F_DEPRECATED
+                if "tentative" in fields:
+                    flags |= IFA_F_TENTATIVE
+                addresses.append((address, flags))
+    return addresses
+
+
+def interface_public_ip(interface: str, record_type: str = "A"):
+    """
+    读取网卡上的公网地址, 跳过私有、链路本地等非全局地址
+    IPv6 跳过临时及不可用地址, 优先返回稳定地址
+    """
+    try:
+        addresses = netlink_addresses(socket.if_nametoindex(interface))
+    except (AttributeError, OSError) as NetlinkError:
+        logger.debug("rtnetlink 不可用, 使用 ip addr, %s", NetlinkError)
+        try:
+            addresses = ip_command_addresses(interface)
+        except (OSError, subprocess.SubprocessError) as IpCommandError:
+            logger.error("读取网卡 %s 地址失败, %s", interface, IpCommandError)
+            return None
+
+    version = 6 if record_type == "AAAA" else 4
+    candidates = []
+    for address, flags in addresses:
+        ip = ipaddress.ip_address(address)
+        if ip.version != version or not ip.is_global:
+            continue
+        if flags & (IFA_F_DEPRECATED | IFA_F_TENTATIVE):
+            continue
+        candidates.append((bool(flags & IFA_F_TEMPORARY), address))
+    if not candidates:
+        return None
+    return min(candidates)[1]
+
+
+class FamilyAdapter(requests.adapters.HTTPAdapter):
+    """
+    固定地址族的连接池, 绑定对应地址族的本地地址,
+    双栈域名解析出的其他地址族连接会失败并跳过
+    """
+
+    def __init__(self, family: int, **kwargs):
+        self.source_address = ("::", 0) if family == socket.AF_INET6 else ("0.0.0.0", 0)
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["source_address"] = self.source_address
+        super().init_poolmanager(*args, **kwargs)
+
+
+# 阿里云API可重试的错误码, 其余错误码视为不可重试
+RETRYABLE_CODES = {
+    "ServiceUnavailable",
+    "InternalError",
+    "UnknownError",
+    "LastOperationNotFinished",
+}
+
+
+def classify_error(error: Exception) -> tuple:
+    """
+    返回 (错误码, 是否可重试)
+    限流及服务端错误可重试, 参数、鉴权等错误不可重试, 无错误码的网络错误可重试
+    """
+    # 新版 SDK 将错误包装在 UnretryableException 中
+    error = getattr(error, "inner_exception", None) or error
+    code = getattr(error, "code", None)
+    if code:
+        status_code = getattr(error, "status_code", None) or getattr(
+            error, "statusCode", None
+        )
+        retryable = (
+            code.startswith("Throttling")
+            or code in RETRYABLE_CODES
+            or (isinstance(status_code, int) and status_code >= 500)
+        )
+        return code, retryable
+    retryable = isinstance(error, (OSError, requests.exceptions.RequestException))
+    return type(error).__name__, retryable
+
+
+class TokenBucket:
+    """令牌桶限流, 多条记录批量请求时保持在账号 QPS 限制内"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # 预占令牌, 令牌不足时在锁外等待
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Record:
+    """解析记录配置项"""
+
+    __slots__ = ("domain_name", "rr", "type", "line", "notify")
+
+    def __init__(
+        self,
+        domain_name: str,
+        rr: str,
+        type: str,
+        line: str = "default",
+        notify: list = None,
+    ):
+        self.domain_name = domain_name
+        self.rr = rr
+        self.type = type
+        self.line = line
+        # 接收通知的后端名称, 为空时发送至全部后端
+        self.notify = notify
+
+    @property
+    def key(self) -> str:
+        """状态文件中的记录键"""
+        return f"{self.rr}.{self.domain_name}|{self.type}|{self.line}"
+
+    def __str__(self):
+        return f"{self.rr}.{self.domain_name}({self.type})"
+
+
+class RemoteRecord:
+    """远程解析记录"""
+
+    __slots__ = ("record_id", "rr", "type", "line", "value", "ttl", "status")
+
+    def __init__(self, record_id, rr, type, line, value, ttl=None, status=None):
+        self.record_id = record_id
+        self.rr = rr
+        self.type = type
+        self.line = line
+        self.value = value
+        self.ttl = ttl
+        self.status = status
+
+    @property
+    def index_key(self) -> tuple:
+        return self.rr, self.type, self.line
+
+
+def decode_records(response) -> tuple:
+    """
+    直接读取 DescribeDomainRecords 响应字段, 返回 (记录列表, 记录总数)
+    避免序列化后再做 jsonpath 全树扫描
+    """
+    body = response.body
+    if body is None or body.domain_records is None:
+        return [], 0
+    records = [
+        RemoteRecord(
+            item.record_id,
+            item.rr,
+            item.type,
+            item.line or "default",
+            item.value,
+            item.ttl,
+            item.status,
+        )
+        for item in body.domain_records.record or ()
+    ]
+    return records, body.total_count or 0
+
+
+def decode_records_body(body: dict) -> tuple:
+    """slim 传输返回的 DescribeDomainRecords 响应体, 返回 (记录列表, 记录总数)"""
+    records = [
+        RemoteRecord(
+            item.get("RecordId"),
+            item.get("RR"),
+            item.get("Type"),
+            item.get("Line") or "default",
+            item.get("Value"),
+            item.get("TTL"),
+            item.get("Status"),
+        )
+        for item in (body.get("DomainRecords") or {}).get("Record") or ()
+    ]
+    return records, body.get("TotalCount") or 0
+
+
+def atomic_write_text(path: Path, text: str):
+    """写入临时文件后 rename, 避免写入中断导致文件损坏"""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as tmp_file:
+        tmp_file.write(text)
+        tmp_file.flush()
+        os.fsync(tmp_file.fileno())
+    os.replace(tmp_path, path)
+
+
+def atomic_write_json(path: Path, data):
+    atomic_write_text(
+        path, json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    )
+
+
+class StateStore:
+    """
+    记录状态存储, 每条记录保存 记录值 / RecordId / 最近校验时间 / 版本号
+    另保存各记录类型已确认的IP、待确认的新IP及被跳过的IP变化(审计)
+    写入使用临时文件 + rename 保证原子性, 文件锁避免多个实例同时运行
+    """
+
+    schema = 1
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock_path = path.with_name(path.name + ".lock")
+        self.lock_file = None
+        self.records = {}
+        self.debounce = {}
+        self.audit = []
+        self.dirty = False
+        self.loaded_stat = None
+        self.lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        """非阻塞获取文件锁, 已被其他实例持有时返回 False"""
+        if fcntl is None:
+            return True
+        self.lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.lock_file.close()
+            self.lock_file = None
+            return False
+        return True
+
+    def release(self):
+        if self.lock_file is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+            self.lock_file = None
+
+    def load(self):
+        """读取状态文件, 文件未变化时沿用内存中的数据"""
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            self.records, self.loaded_stat = {}, None
+            self.debounce, self.audit = {}, []
+            return
+        stat_key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if stat_key == self.loaded_stat and not self.dirty:
+            return
+
+        with open(self.path, "r", encoding="utf-8") as state_file:
+            content = state_file.read()
+        try:
+            data = json.loads(content) if content.strip() else {}
+        except ValueError:
+            # 旧版 yaml 格式, 重新查询远程记录后覆盖
+            logger.info("%s 为旧版格式, 将重新生成", self.path)
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+        self.records = data.get("records") or {}
+        self.debounce = data.get("debounce") or {}
+        self.audit = data.get("audit") or []
+        self.loaded_stat = stat_key
+        self.dirty = False
+
+    def get(self, key: str):
+        return self.records.get(key)
+
+    def put(self, key: str, record_id: str, value: str, verified_at: float = None):
+        with self.lock:
+            entry = self.records.get(key)
+            if entry is None:
+                version = 1
+            elif entry["record_id"] != record_id or entry["value"] != value:
+                version = entry["version"] + 1
+            elif verified_at is None:
+                return
+            else:
+                version = entry["version"]
+            self.records[key] = {
+                "record_id": record_id,
+                "value": value,
+                "verified_at": verified_at or (entry or {}).get("verified_at"),
+                "version": version,
+            }
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        atomic_write_json(
+            self.path,
+            {
+                "schema": self.schema,
+                "records": self.records,
+                "debounce": self.debounce,
+                "audit": self.audit,
+            },
+        )
+        stat = self.path.stat()
+        self.loaded_stat = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        self.dirty = False
+
+
+class SourceHealth:
+    """
+    公网IP检测链接的健康评分, 记录延迟与错误率的 EWMA
+    连续失败达到 failure_threshold 次后熔断, 冷却时间按连续失败次数指数增长
+    """
+
+    def __init__(self, path: Path, config: dict):
+        self.path = path
+        self.alpha: float = config.get("ewma_alpha", 0.3)
+        self.failure_threshold: int = config.get("failure_threshold", 3)
+        self.cooldown: float = config.get("cooldown", 300)
+        self.sources = {}
+        self.lock = threading.Lock()
+        self.settled = threading.Condition(self.lock)
+        self.dirty = False
+        # 进行中的请求 {请求标识: (来源, 截止时间)}, 达到 quorum 后仍在进行的请求完成时由请求线程记录,
+        # 下次保存时写入, 退出前由 close 等待
+        self.in_flight = {}
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as sources_file:
+                self.sources = json.load(sources_file)
+        except (OSError, ValueError):
+            self.sources = {}
+
+    def start(self, url: str, timeout: float) -> object:
+        """登记一次请求, 返回传给 record 的请求标识"""
+        probe = object()
+        with self.lock:
+            self.in_flight[probe] = (url, time.monotonic() + timeout)
+        return probe
+
+    def close(self):
+        """
+        退出前等待进行中的请求完成并保存, 避免较慢的来源从未被评分而一直优先
+        超过请求超时时间仍未完成的请求按失败记录
+        """
+        with self.lock:
+            while self.in_flight:
+                remaining = max(deadline for _, deadline in self.in_flight.values())
+                remaining -= time.monotonic()
+                if remaining <= 0:
+                    break
+                self.settled.wait(remaining)
+            timed_out = [url for url, _ in self.in_flight.values()]
+            self.in_flight.clear()
+        for url in timed_out:
+            logger.debug("[%s] 请求超时", url)
+            metrics.inc("aliyun_ddns_ip_source_errors_total", source=url)
+            self.record(url, error=True)
+        self.save()
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = dict(self.sources)
+            self.dirty = False
+        atomic_write_json(self.path, data)
+
+    def record(
+        self, url: str, latency: float = None, error: bool = False, probe: object = None
+    ):
+        with self.lock:
+            if probe is not None:
+                if probe not in self.in_flight:
+                    # close 时已按超时记录
+                    return
+                del self.in_flight[probe]
+                self.settled.notify_all()
+            source = self.sources.setdefault(
+                url, {"latency": None, "error_rate": 0.0, "failures": 0, "open_until": 0}
+            )
+            alpha = self.alpha
+            source["error_rate"] = (1 - alpha) * source["error_rate"] + alpha * error
+            if error:
+                source["failures"] += 1
+                if source["failures"] >= self.failure_threshold:
+                    exponent = source["failures"] - self.failure_threshold
+                    cooldown = min(self.cooldown * 2 ** exponent, 3600)
+                    source["open_until"] = time.time() + cooldown
+                    logger.warning(
+                        "[%s] 连续失败 %s 次, 熔断 %.0fs",
+                        url,
+                        source["failures"],
+                        cooldown,
+                    )
+            else:
+                source["failures"] = 0
+                source["open_until"] = 0
+                if source["latency"] is None:
+                    source["latency"] = latency
+                else:
+                    source["latency"] = (1 - alpha) * source["latency"] + alpha * latency
+            self.dirty = True
+
+    def score(self, url: str) -> float:
+        """评分越低越优先, 未探测过的来源评分为 0 以便尽快探测"""
+        source = self.sources.get(url)
+        if source is None:
+            return 0.0
+        if source["latency"] is None:
+            # 从未成功的来源按错误率排在后面
+            return 10 * source["error_rate"]
+        return source["latency"] * (1 + 4 * source["error_rate"])
+
+    def available(self, url: str, now: float) -> bool:
+        """熔断冷却结束后允许再次尝试"""
+        source = self.sources.get(url)
+        return source is None or source["open_until"] <= now
+
+    def rank(self, urls: list, fanout: int, minimum: int) -> list:
+        """
+        按评分选取前 fanout 个可用来源(0 为全部),
+        可用来源不足 minimum 个时按冷却结束时间补充熔断中的来源
+        """
+        now = time.time()
+        available = sorted(
+            (url for url in urls if self.available(url, now)), key=self.score
+        )
+        tripped = sorted(
+            (url for url in urls if not self.available(url, now)),
+            key=lambda url: self.sources[url]["open_until"],
+        )
+        for url in available + tripped:
+            source = self.sources.get(url) or {}
+            logger.debug(
+                "[%s] 评分 %.3f 错误率 %.2f %s",
+                url,
+                self.score(url),
+                source.get("error_rate", 0),
+                "可用" if url in available else "熔断中",
+            )
+        # fanout 小于 minimum(quorum) 时仍选取 minimum 个, 否则无法达到 quorum
+        selected = available[: max(fanout, minimum)] if fanout > 0 else available
+        if len(selected) < minimum:
+            selected += tripped[: minimum - len(selected)]
+        return selected
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# 指标名称: (类型, 说明)
+METRIC_TYPES = {
+    "aliyun_ddns_phase_duration_seconds": (
+        "histogram",
+        "Duration of each sync phase (detect, describe, update, notify, plan, apply, run).",
+    ),
+    "aliyun_ddns_ip_source_duration_seconds": (
+        "histogram",
+        "Latency of successful public IP source requests.",
+    ),
+    "aliyun_ddns_ip_source_errors_total": (
+        "counter",
+        "Failed public IP source requests.",
+    ),
+    "aliyun_ddns_updates_total": ("counter", "Record updates by status and reason."),
+    "aliyun_ddns_drift_fixes_total": (
+        "counter",
+        "Remote records modified outside this tool and restored.",
+    ),
+    "aliyun_ddns_failures_total": ("counter", "Failures by phase."),
+    "aliyun_ddns_api_retries_total": ("counter", "Retried Alidns API calls by action."),
+    "aliyun_ddns_skipped_transitions_total": (
+        "counter",
+        "Unconfirmed IP changes dropped by debouncing, by type and outcome.",
+    ),
+    "aliyun_ddns_notifications_total": (
+        "counter",
+        "Notification batches by backend and status.",
+    ),
+    "aliyun_ddns_records": ("gauge", "Configured records."),
+    "aliyun_ddns_leader": ("gauge", "1 if this node holds the coordination lease."),
+    "aliyun_ddns_last_run_timestamp_seconds": ("gauge", "Unix time of the last run."),
+    "aliyun_ddns_last_success_timestamp_seconds": (
+        "gauge",
+        "Unix time of the last run that detected the IP and applied every change.",
+    ),
+}
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """
+    Prometheus 指标, 按文本格式输出
+    常驻运行时由 /metrics 提供, 单次运行时写入 node_exporter textfile collector 目录
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.values.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.values.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+
+    @contextlib.contextmanager
+    def timer(self, phase: str):
+        """统计代码块耗时, 抛出异常时计入该阶段失败"""
+        start = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.inc("aliyun_ddns_failures_total", phase=phase)
+            raise
+        finally:
+            self.observe(
+                "aliyun_ddns_phase_duration_seconds",
+                time.monotonic() - start,
+                phase=phase,
+            )
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            for name, (metric_type, help_text) in METRIC_TYPES.items():
+                series = self.values.get(name)
+                if not series:
+                    continue
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in sorted(series.items()):
+                    if metric_type != "histogram":
+                        lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+                        continue
+                    counts, total, count = value
+                    cumulative = 0
+                    for bound, bucket_count in zip(self.buckets, counts):
+                        cumulative += bucket_count
+                        le = format_labels(labels + (("le", format_value(bound)),))
+                        lines.append(f"{name}_bucket{le} {cumulative}")
+                    le = format_labels(labels + (("le", "+Inf"),))
+                    lines.append(f"{name}_bucket{le} {count}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {format_value(total)}")
+                    lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def load_textfile(self, path: Path):
+        """
+        单次运行时进程内的指标从零开始,
+        从上次写入的 textfile 中恢复最近成功同步时间, 失败的运行不会将其清空
+        """
+        name = "aliyun_ddns_last_success_timestamp_seconds"
+        try:
+            with open(path, "r", encoding="utf-8") as textfile:
+                for line in textfile:
+                    if line.startswith(name + " "):
+                        self.set(name, float(line.split()[1]))
+        except (OSError, ValueError, IndexError):
+            pass
+
+    def write_textfile(self, path: Path):
+        atomic_write_text(path, self.render())
+
+
+metrics = Metrics()
+
+
+def create_metrics_server(host: str, port: int):
+    """/metrics 服务, 仅常驻运行时使用, 按需导入 http.server"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            data = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logger.debug("[metrics] %s %s", self.address_string(), format % args)
+
+    class MetricsServer(ThreadingHTTPServer):
+        daemon_threads = True
+        address_family = socket.AF_INET6 if ":" in host else socket.AF_INET
+
+    return MetricsServer((host, port), MetricsHandler)
+
+
+class Notifier:
+    """通知后端, send 接收合并窗口内的一批通知"""
+
+    def __init__(self, name: str, config: dict):
+        self.name = name
+        self.config = config
+
+    def send(self, events: list):
+        raise NotImplementedError
+
+    def idle(self):
+        """队列空闲时调用, 用于释放连接"""
+
+    def close(self):
+        self.idle()
+
+
+class SmtpNotifier(Notifier):
+    """邮件通知, 一封邮件发送给全部收件人, SMTP 会话在空闲超时前复用"""
+
+    def __init__(self, name: str, config: dict):
+        super().__init__(name, config)
+        self.smtp = None
+
+    def connect(self):
+        import smtplib
+
+        if self.smtp is not None:
+            try:
+                if self.smtp.noop()[0] == 250:
+                    return self.smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.smtp = None
+
+        if self.config.get("ssl") is True:
+            smtp = smtplib.SMTP_SSL(self.config.get("host"), self.config.get("port"))
+        else:
+            smtp = smtplib.SMTP(self.config.get("host"), self.config.get("port"))
+        smtp.login(self.config.get("username"), self.config.get("password"))
+        self.smtp = smtp
+        return smtp
+
+    def idle(self):
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except Exception:
+            pass
+        self.smtp = None
+
+    def send(self, events: list):
+        if len(events) == 1:
+            header, msg = events[0]["header"], events[0]["message"]
+        else:
+            failed = sum(1 for event in events if event["header"].startswith("[FAIL]"))
+            header = f"[DIGEST]UpdateDomainRecord {len(events)} 条, 失败 {failed} 条"
+            msg = "\n".join(f"{event['header']} {event['message']}" for event in events)
+
+        from email.header import Header
+        from email.mime.text import MIMEText
+
+        to_addresses = self.config.get("to_addresses")
+        message = MIMEText(msg, "plain", "utf-8")
+        message["From"] = Header(self.config.get("from_address"), "utf-8")
+        message["To"] = Header(", ".join(to_addresses), "utf-8")
+        message["Subject"] = Header(header, "utf-8")
+
+        try:
+            self.connect().sendmail(
+                self.config.get("username"), to_addresses, message.as_string()
+            )
+        except Exception:
+            self.idle()
+            raise
+
+
+class WebhookNotifier(Notifier):
+    """HTTP 回调通知, 一批通知合并为一次 JSON POST, 失败按指数退避重试"""
+
+    def __init__(self, name: str, config: dict):
+        super().__init__(name, config)
+        retry = Retry(
+            total=config.get("retries", 3),
+            backoff_factor=config.get("backoff", 0.5),
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=None,
+        )
+        adapter = requests.adapters.HTTPAdapter(max_retries=retry, pool_maxsize=2)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(config.get("headers") or {})
+
+    def send(self, events: list):
+        response = self.session.post(
+            self.config.get("url"),
+            json={"events": events},
+            timeout=self.config.get("timeout", 5),
+        )
+        response.raise_for_status()
+
+    def close(self):
+        self.session.close()
+
+
+class FileNotifier(Notifier):
+    """本地文件通知, 每条通知写入一行 JSON"""
+
+    def send(self, events: list):
+        path = Path(self.config.get("path", "~/.ddns_events.jsonl")).expanduser()
+        lines = "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events)
+        with open(path, "a", encoding="utf-8") as events_file:
+            events_file.write(lines)
+
+
+NOTIFIER_TYPES = {
+    "smtp": SmtpNotifier,
+    "webhook": WebhookNotifier,
+    "file": FileNotifier,
+}
+
+
+class NotificationQueue:
+    """
+    通知队列, 后台线程发送, 不阻塞记录更新
+    digest_window 秒内的多条通知按后端合并, 各后端并发发送
+    """
+
+    def __init__(self, notifiers: dict, digest_window: float = 5, idle_timeout: float = 60):
+        self.notifiers = notifiers
+        self.digest_window = digest_window
+        self.idle_timeout = idle_timeout
+        self.queue = queue.Queue()
+        self.worker = None
+        self.executor = None
+        # 多个线程并发更新记录时同时发送通知, 后台线程只启动一次
+        self.lock = threading.Lock()
+
+    def notify(self, header: str, msg: str, targets=None, **fields):
+        """targets 为接收通知的后端名称, 为空时发送至全部后端"""
+        names = [
+            name for name in (targets or self.notifiers) if name in self.notifiers
+        ]
+        if not names:
+            logger.debug("未配置通知, 忽略 %s %s", header, msg)
+            return
+        event = {"time": time.time(), "header": header, "message": msg, **fields}
+        with self.lock:
+            if self.worker is None:
+                # 每个后台线程使用独立的队列及发送线程池, 关闭超时的旧线程不影响之后的通知
+                self.queue = queue.Queue()
+                self.executor = ThreadPoolExecutor(max_workers=len(self.notifiers))
+                self.worker = threading.Thread(
+                    target=self.work, args=(self.queue, self.executor), daemon=True
+                )
+                self.worker.start()
+            self.queue.put((names, event))
+
+    def close(self, timeout: float = 30):
+        """
+        发送完队列中的通知后停止后台线程, 后台线程退出后再关闭发送线程池
+        超时后后台线程继续发送剩余通知, 记录未发送的数量
+        """
+        with self.lock:
+            worker, events = self.worker, self.queue
+            self.worker = self.executor = None
+            if worker is not None:
+                events.put(None)
+        if worker is not None:
+            worker.join(timeout)
+            if worker.is_alive():
+                # 未完成的任务包括结束标记
+                logger.warning(
+                    "通知队列 %ss 内未发送完成, 剩余 %s 条通知在后台继续发送",
+                    timeout,
+                    events.unfinished_tasks - 1,
+                )
+                return
+        for notifier in self.notifiers.values():
+            notifier.close()
+
+    def work(self, events: queue.Queue, executor: ThreadPoolExecutor):
+        try:
+            self.process(events, executor)
+        finally:
+            executor.shutdown()
+            # 结束标记在线程退出时才标记完成, close 超时时据此计算未发送的数量
+            events.task_done()
+
+    def process(self, events: queue.Queue, executor: ThreadPoolExecutor):
+        stopping = False
+        while not stopping:
+            try:
+                item = events.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                for notifier in self.notifiers.values():
+                    notifier.idle()
+                continue
+            if item is None:
+                break
+
+            # 合并窗口内的后续通知
+            batch = [item]
+            deadline = time.monotonic() + self.digest_window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = events.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self.dispatch(batch, executor)
+            for _ in batch:
+                events.task_done()
+
+    def dispatch(self, batch: list, executor: ThreadPoolExecutor):
+        events_by_notifier = {}
+        for names, event in batch:
+            for name in names:
+                events_by_notifier.setdefault(name, []).append(event)
+
+        futures = {
+            executor.submit(self.send, name, events): name
+            for name, events in events_by_notifier.items()
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                future.result()
+                metrics.inc("aliyun_ddns_notifications_total", notifier=name, status="success")
+                logger.debug("[%s] 通知发送完成", name)
+            except Exception as NotifyError:
+                metrics.inc("aliyun_ddns_notifications_total", notifier=name, status="failure")
+                logger.error("[%s] 通知发送失败, %s", name, NotifyError)
+
+    def send(self, name: str, events: list):
+        with metrics.timer("notify"):
+            self.notifiers[name].send(events)
+
+
+class FileLease:
+    """
+    共享文件系统上的租约文件, 内容为 {"holder", "expires"}
+    租约不存在时以 os.link 原子创建, 过期租约先 rename 移走, 只有一个节点能成功
+    各节点观察到的IP写入 <租约文件>.nodes/<节点>.json
+    """
+
+    def __init__(self, node_id: str, ttl: float, config: dict):
+        self.node_id = node_id
+        self.ttl = ttl
+        self.path = Path(config.get("path", "~/.ddns_lease")).expanduser()
+        self.nodes_dir = self.path.with_name(self.path.name + ".nodes")
+        self.holder = None
+
+    def __str__(self):
+        return str(self.path)
+
+    def read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as lease_file:
+                lease = json.load(lease_file)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # 写入中断的租约视为已过期
+            return {"holder": None, "expires": 0}
+        return lease if isinstance(lease, dict) else {"holder": None, "expires": 0}
+
+    def acquire(self) -> bool:
+        """获取或续约, 其他节点持有未过期的租约时返回 False"""
+        now = time.time()
+        lease = self.read()
+        if lease is not None and lease.get("expires", 0) > now:
+            self.holder = lease.get("holder")
+            if self.holder != self.node_id:
+                return False
+            atomic_write_json(self.path, {"holder": self.node_id, "expires": now + self.ttl})
+            return True
+
+        if lease is not None:
+            stale_path = self.path.with_name(
+                f"{self.path.name}.{self.node_id}.{os.getpid()}.stale"
+            )
+            try:
+                os.rename(self.path, stale_path)
+            except FileNotFoundError:
+                pass
+            else:
+                with open(stale_path, "r", encoding="utf-8") as stale_file:
+                    stale = stale_file.read()
+                try:
+                    expires = json.loads(stale).get("expires", 0)
+                except (ValueError, AttributeError):
+                    expires = 0
+                if expires > now:
+                    # 移走的是其他节点刚获取的租约, 恢复
+                    try:
+                        os.link(stale_path, self.path)
+                    except FileExistsError:
+                        pass
+                os.unlink(stale_path)
+
+        tmp_path = self.path.with_name(f"{self.path.name}.{self.node_id}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as tmp_file:
+            json.dump({"holder": self.node_id, "expires": now + self.ttl}, tmp_file)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        try:
+            os.link(tmp_path, self.path)
+            acquired = True
+        except FileExistsError:
+            acquired = False
+        finally:
+            os.unlink(tmp_path)
+        self.holder = self.node_id if acquired else (self.read() or {}).get("holder")
+        return acquired
+
+    def release(self):
+        lease = self.read()
+        if lease is not None and lease.get("holder") == self.node_id:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        pass
+
+    def report(self, observation: dict):
+        self.nodes_dir.mkdir(parents=True, exist_ok=True)
+        atomic_write_json(self.nodes_dir / f"{self.node_id}.json", observation)
+
+    def observations(self) -> dict:
+        observations = {}
+        for node_file in self.nodes_dir.glob("*.json"):
+            try:
+                with open(node_file, "r", encoding="utf-8") as f:
+                    observations[node_file.stem] = json.load(f)
+            except (OSError, ValueError):
+                continue
+        return observations
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisLease:
+    """
+    Redis 租约, SET NX PX 获取, 持有者以脚本原子续约及释放
+    各节点观察到的IP写入哈希 <key>:nodes
+    仅实现所需的 RESP 命令, 兼容 Redis / Valkey / KeyDB 等
+    """
+
+    RENEW_SCRIPT = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then "
+        "return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+    )
+    RELEASE_SCRIPT = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then "
+        "return redis.call('del', KEYS[1]) else return 0 end"
+    )
+
+    def __init__(self, node_id: str, ttl: float, config: dict):
+        self.node_id = node_id
+        self.ttl = ttl
+        url = urlsplit(config.get("url", "redis://127.0.0.1:6379/0"))
+        self.host = url.hostname or "127.0.0.1"
+        self.port = url.port or 6379
+        self.password = url.password
+        self.db = int(url.path.strip("/") or 0)
+        self.key = config.get("key", "aliyun-ddns:leader")
+        self.timeout = config.get("timeout", 5)
+        self.holder = None
+        self.sock = None
+        self.reader = None
+        self.lock = threading.Lock()
+
+    def __str__(self):
+        return f"redis://{self.host}:{self.port}/{self.db} {self.key}"
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), self.timeout)
+        self.reader = self.sock.makefile("rb")
+        if self.password:
+            self.send("AUTH", self.password)
+        if self.db:
+            self.send("SELECT", self.db)
+
+    def close(self):
+        if self.sock is not None:
+            self.reader.close()
+            self.sock.close()
+            self.sock = self.reader = None
+
+    def send(self, *args):
+        data = [f"*{len(args)}\r\n".encode("utf-8")]
+        for arg in args:
+            arg = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            data.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        self.sock.sendall(b"".join(data))
+        return self.read_reply()
+
+    def read_reply(self):
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Redis 连接已关闭")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b"+":
+            return payload.decode("utf-8")
+        if prefix == b"-":
+            raise RedisError(payload.decode("utf-8"))
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            return self.reader.read(length + 2)[:-2].decode("utf-8")
+        if prefix == b"*":
+            length = int(payload)
+            return None if length < 0 else [self.read_reply() for _ in range(length)]
+        raise RedisError(f"无法解析的响应 {line!r}")
+
+    def command(self, *args):
+        """连接断开时重连后重试一次"""
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.sock is None:
+                        self.connect()
+                    return self.send(*args)
+                except OSError:
+                    self.close()
+                    if attempt:
+                        raise
+
+    def acquire(self) -> bool:
+        ttl_ms = int(self.ttl * 1000)
+        if self.command("SET", self.key, self.node_id, "NX", "PX", ttl_ms) == "OK":
+            self.holder = self.node_id
+            return True
+        if self.command("EVAL", self.RENEW_SCRIPT, 1, self.key, self.node_id, ttl_ms) == 1:
+            self.holder = self.node_id
+            return True
+        self.holder = self.command("GET", self.key)
+        return False
+
+    def release(self):
+        self.command("EVAL", self.RELEASE_SCRIPT, 1, self.key, self.node_id)
+
+    def report(self, observation: dict):
+        self.command("HSET", f"{self.key}:nodes", self.node_id, json.dumps(observation))
+
+    def observations(self) -> dict:
+        values = self.command("HGETALL", f"{self.key}:nodes") or []
+        observations = {}
+        for node_id, value in zip(values[::2], values[1::2]):
+            try:
+                observations[node_id] = json.loads(value)
+            except ValueError:
+                continue
+        return observations
+
+
+LEASE_TYPES = {
+    "file": FileLease,
+    "redis": RedisLease,
+}
+
+
+class AliyunDDNS:
+
+    def __init__(self, argv: list = None):
         parser = argparse.ArgumentParser(
             description="Aliyun-DDNS by Jinx@qqAys in Dec. 2024"
         )
@@ -37,34 +1390,205 @@ class AliyunDDNS:
         parser.add_argument(
             "--debug", required=False, action="store_true", help="打开调试"
         )
-        args = parser.parse_args()
+        parser.add_argument(
+            "--daemon", required=False, action="store_true", help="常驻运行, 按间隔检查"
+        )
+        plan_group = parser.add_mutually_exclusive_group()
+        plan_group.add_argument(
+            "--plan",
+            required=False,
+            action="store_true",
+            help="只输出需要执行的变更(JSON), 不更改解析记录",
+        )
+        plan_group.add_argument(
+            "--apply",
+            type=str,
+            required=False,
+            metavar="PLAN_FILE",
+            help="执行 --plan 输出的变更, - 为标准输入",
+        )
+        parser.add_argument(
+            "--watch",
+            required=False,
+            action="store_true",
+            help="常驻运行, 网卡地址变化时立即检查(仅Linux)",
+        )
+        self.args = parser.parse_args(argv)
 
-        if args.debug is True:
+        if self.args.debug is True:
             logger.setLevel(logging.DEBUG)
         else:
             logger.setLevel(logging.INFO)
 
         self.config_file = None
-        self.parse_args(args)
+        self.parse_args(self.args)
+
+        self.state = None
+        self.source_health = None
+        self.notifier = None
+        self.lease = None
+        self.coordination_config = {}
+        self.lease_lock = threading.Lock()
+        self.is_leader = False
+        # 最近一次获取租约是否失败(而非由其他节点持有)
+        self.lease_error = False
+
+        # 进程内复用的阿里云客户端与HTTP连接池
+        self.client = None
+        self.client_lock = threading.Lock()
+        self.runtime = None
+        self.http_sessions = {}
+        self.batch_unavailable = False
 
+        self.load_config()
+
+        self.wakeup = threading.Event()
+        self.reload_requested = False
+        self.stop_requested = False
+        self.address_changed = False
+
+    def load_config(self):
+        """
+        读取并校验全部配置后一次性替换, 任一步骤失败时继续使用原配置
+        """
         config: dict = self.parse_config()
 
-        self.temp_data_file = Path(Path.home(), ".ddns_data")
-        self.temp_data_file.touch(exist_ok=True)
+        public_ip_config: dict = config.get("public_ip") or {}
+        account_config = config.get("account")
+        domain_config = config.get("domain")
+        if not isinstance(account_config, dict) or not isinstance(domain_config, dict):
+            raise ValueError(f"{self.config_file} 缺少 account 或 domain 配置")
+        public_ip_source = public_ip_config.get("source", "http")
+        if public_ip_source in ("interface", "hybrid") and not public_ip_config.get(
+            "interface"
+        ):
+            raise ValueError(
+                f"{self.config_file} public_ip.source 为 {public_ip_source} 时需配置 public_ip.interface"
+            )
+
+        # sdk 为阿里云SDK, slim 为 slim.py 中无外部依赖的轻量实现
+        dns_transport: str = domain_config.get("transport", "sdk")
+        if dns_transport not in ("sdk", "slim"):
+            logger.error("未知的 domain.transport %s, 使用 sdk", dns_transport)
+            dns_transport = "sdk"
+        records: list = self.parse_records(config)
 
-        self.public_ip_config: dict = config.get("public_ip")
+        api_config: dict = config.get("api") or {}
+        if api_config.get("batch_threshold", 0) > 0 and not api_config.get("batch_type"):
+            # OperateBatchDomain 文档中没有修改记录值的操作类型, 不提供默认值
+            logger.error("api.batch_threshold 需同时配置 api.batch_type, 不启用批量更新")
+        qps = api_config.get("qps", 10)
+        rate_limiter = TokenBucket(qps, api_config.get("burst", qps))
 
-        self.access_key_id: str = config.get("account").get("access_key_id")
-        self.access_key_secret: str = config.get("account").get("access_key_secret")
+        state_config: dict = config.get("state") or {}
+        state_file = Path(state_config.get("file", "~/.ddns_data")).expanduser()
+        state = self.state
+        if state is None or state.path != state_file:
+            state = StateStore(state_file)
+        if self.source_health is not None:
+            # 写入上次保存后完成的请求结果, 再由新实例读取
+            self.source_health.save()
+        source_health = SourceHealth(
+            state_file.with_name(state_file.name + ".sources"), public_ip_config
+        )
+        source_health.load()
+
+        # 多节点协调, 只有持有租约的节点更新记录
+        coordination_config: dict = config.get("coordination") or {}
+        backend = coordination_config.get("backend")
+        lease = None
+        if backend and backend not in LEASE_TYPES:
+            logger.error("未知的 coordination.backend %s, 不启用多节点协调", backend)
+        elif backend:
+            node_id = str(coordination_config.get("node_id") or socket.gethostname())
+            ttl = coordination_config.get("ttl", 60)
+            if (
+                type(self.lease) is LEASE_TYPES[backend]
+                and self.lease.node_id == node_id
+                and self.lease.ttl == ttl
+                and coordination_config == self.coordination_config
+            ):
+                # 协调配置未变化时沿用现有租约, 续约不中断
+                lease = self.lease
+            else:
+                lease = LEASE_TYPES[backend](node_id, ttl, coordination_config)
 
-        self.dns_end_point: str = config.get("domain").get("dns_end_point")
-        self.domain_name: str = config.get("domain").get("name")
-        self.rr_key_word: str = config.get("domain").get("rr")
-        self.type_key_word: str = config.get("domain").get("type")
+        notifier = self.create_notifier(config)
 
-        self.remote_record_id = None
+        # 全部解析完成, 替换配置
+        configure_logging(config.get("logging") or {})
+        self.public_ip_config: dict = public_ip_config
+        self.access_key_id: str = account_config.get("access_key_id")
+        self.access_key_secret: str = account_config.get("access_key_secret")
+        self.dns_end_point: str = domain_config.get("dns_end_point")
+        self.dns_protocol: str = domain_config.get("protocol", "HTTPS")
+        self.dns_transport: str = dns_transport
+        # DescribeDomainRecords 单页上限 500
+        self.page_size: int = min(domain_config.get("page_size", 500), 500)
+        self.records: list = records
+        self.records_by_key: dict = {record.key: record for record in records}
+        self.daemon_config: dict = config.get("daemon") or {}
+        self.api_config: dict = api_config
+        self.rate_limiter = rate_limiter
+        self.state_config: dict = state_config
+        self.metrics_config: dict = config.get("metrics") or {}
+        self.debounce_config: dict = config.get("debounce") or {}
+        self.coordination_config: dict = coordination_config
+        previous_lease, self.lease = self.lease, lease
+        self.state = state
+        self.source_health = source_health
+        previous_notifier, self.notifier = self.notifier, notifier
+        # 凭据或接入点可能变化, 下次使用时重建
+        with self.client_lock:
+            previous_client, self.client = self.client, None
+        self.batch_unavailable = False
 
-        self.smtp_config: dict = config.get("smtp")
+        if self.metrics_config.get("textfile"):
+            metrics.load_textfile(Path(self.metrics_config["textfile"]).expanduser())
+        metrics.set("aliyun_ddns_records", len(self.records))
+
+        # 配置变化时发送完旧配置下排队的通知
+        if previous_notifier is not None:
+            previous_notifier.close()
+        # slim 客户端关闭连接池中保持的连接, 阿里云SDK客户端无需关闭
+        if previous_client is not None and hasattr(previous_client, "close"):
+            previous_client.close()
+        # 租约配置变化时释放原租约, 之后按新租约重新竞选
+        if previous_lease is not None and previous_lease is not lease:
+            if self.is_leader:
+                self.release_lease(previous_lease)
+            with self.lease_lock:
+                previous_lease.close()
+            self.is_leader = False
+
+    @staticmethod
+    def create_notifier(config: dict) -> NotificationQueue:
+        """
+        解析 notifiers 配置, 兼容旧版 smtp 配置
+        """
+        notifiers_config = dict(config.get("notifiers") or {})
+        smtp_config = config.get("smtp") or {}
+        if smtp_config.get("host") and "smtp" not in notifiers_config:
+            notifiers_config["smtp"] = {"type": "smtp", **smtp_config}
+
+        notifiers = {}
+        for name, notifier_config in notifiers_config.items():
+            notifier_type = notifier_config.get("type", "smtp")
+            if notifier_type not in NOTIFIER_TYPES:
+                logger.error("[%s] 未知的通知类型 %s", name, notifier_type)
+                continue
+            notifiers[name] = NOTIFIER_TYPES[notifier_type](name, notifier_config)
+
+        notification_config = config.get("notification") or {}
+        return NotificationQueue(
+            notifiers,
+            digest_window=notification_config.get(
+                "digest_window", smtp_config.get("digest_window", 5)
+            ),
+            idle_timeout=notification_config.get(
+                "idle_timeout", smtp_config.get("idle_timeout", 60)
+            ),
+        )
 
     def parse_args(self, args):
         self.config_file = Path("./config.yml")
@@ -73,190 +1597,1143 @@ class AliyunDDNS:
             if custom_config_file.exists():
                 self.config_file = custom_config_file
             else:
-                logger.error(f"{custom_config_file} 配置文件不存在")
+                logger.error("%s 配置文件不存在", custom_config_file)
 
     def parse_config(self):
         with open(self.config_file, "r", encoding="utf-8") as config_file:
-            return yaml.safe_load(config_file)
-
-    def parse_temp_data(self):
-        with open(self.temp_data_file, "r", encoding="utf-8") as temp_data_file:
-            return yaml.safe_load(temp_data_file)
+            # 有 libyaml 时使用 C 实现解析
+            return yaml.load(config_file, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
 
-    def save_temp_data(self, current_ip):
-        data = {"current_ip": current_ip, "remote_record_id": self.remote_record_id}
-        with open(self.temp_data_file, "w", encoding="utf-8") as temp_data_file:
-            return temp_data_file.write(yaml.dump(data))
+    @staticmethod
+    def parse_records(config: dict) -> list:
+        """
+        解析记录配置, 兼容旧版 domain.name/rr/type 单记录写法
+        rr 可为列表, 展开为多条记录
+        """
+        records_config = list(config.get("records") or [])
+        domain_config = config.get("domain") or {}
+        if domain_config.get("name") is not None:
+            records_config.insert(0, domain_config)
 
-    def fetch_current_ip(self):
-        logger.info("获取当前公网IP地址...")
-
-        urls = self.public_ip_config.get("urls", ["https://checkip.amazonaws.com/"])
-        requests_timeout = self.public_ip_config.get("timeout", 5) / 2
-
-        # 抽样
-        if len(urls) >= 2:
-            urls = random.sample(urls, k=2)
+        records = []
+        seen = set()
+        for record_config in records_config:
+            rr_list = record_config.get("rr")
+            if not isinstance(rr_list, list):
+                rr_list = [rr_list]
+            type_list = record_config.get("type", "A")
+            if not isinstance(type_list, list):
+                type_list = [type_list]
+            for rr in rr_list:
+                for record_type in type_list:
+                    if str(record_type).upper() not in ("A", "AAAA"):
+                        logger.warning(
+                            "%s.%s 不支持的记录类型 %s, 已忽略",
+                            rr,
+                            record_config.get("name"),
+                            record_type,
+                        )
+                        continue
+                    record = Record(
+                        record_config.get("name"),
+                        str(rr),
+                        str(record_type).upper(),
+                        record_config.get("line", "default"),
+                        record_config.get("notify"),
+                    )
+                    if record.key in seen:
+                        logger.warning("%s 重复配置, 已忽略", record)
+                        continue
+                    seen.add(record.key)
+                    records.append(record)
+        return records
 
-        url_a, url_b = urls
+    def get_http_session(self, record_type: str = "A") -> requests.Session:
+        """公网IP检测使用的 keep-alive 连接池, A 与 AAAA 分别固定地址族"""
+        with self.client_lock:
+            if record_type not in self.http_sessions:
+                family = socket.AF_INET6 if record_type == "AAAA" else socket.AF_INET
+                adapter = FamilyAdapter(family, pool_connections=16, pool_maxsize=4)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self.http_sessions[record_type] = session
+            return self.http_sessions[record_type]
 
+    def probe_ip(
+        self, url: str, record_type: str, timeout: float, results: queue.Queue, probe: object
+    ):
+        start = time.monotonic()
         try:
-            logger.debug(f"开始请求 [{url_a}]")
-            ip_a = (
-                requests.get(url_a, timeout=(requests_timeout, requests_timeout))
-                .content.decode("utf-8")
-                .replace("\n", "")
-            )
-            logger.debug(f"ip_a[{url_a}] {ip_a}")
-
-            logger.debug(f"开始请求 [{url_b}]")
-            ip_b = (
-                requests.get(url_b, timeout=(requests_timeout, requests_timeout))
+            logger.debug("开始请求 [%s]", url)
+            ip = (
+                self.get_http_session(record_type)
+                .get(url, timeout=(timeout, timeout))
                 .content.decode("utf-8")
-                .replace("\n", "")
+                .strip()
             )
-            logger.debug(f"ip_b[{url_b}] {ip_b}")
+            logger.debug("[%s] %s", url, ip)
+            version = ipaddress.ip_address(ip).version
+            if version != (6 if record_type == "AAAA" else 4):
+                raise ValueError(f"返回的地址 {ip} 与记录类型 {record_type} 不符")
+            latency = time.monotonic() - start
+            self.source_health.record(url, latency=latency, probe=probe)
+            metrics.observe("aliyun_ddns_ip_source_duration_seconds", latency, source=url)
+            results.put((url, ip, None))
         except Exception as e:
-            logger.error(f"请求错误, {e}")
-            return None
+            self.source_health.record(url, error=True, probe=probe)
+            metrics.inc("aliyun_ddns_ip_source_errors_total", source=url)
+            results.put((url, None, e))
+
+    def fetch_current_ip(self, record_type: str = "A"):
+        with metrics.timer("detect"):
+            ip = self.detect_ip(record_type)
+        if ip is None:
+            metrics.inc("aliyun_ddns_failures_total", phase="detect")
+        return ip
+
+    def detect_ip(self, record_type: str = "A"):
+        """
+        source 为 http 时请求检测链接, interface 时读取网卡地址,
+        hybrid 时优先读取网卡地址, 无可用公网地址再请求检测链接
+        """
+        source = self.public_ip_config.get("source", "http")
+        if source in ("interface", "hybrid"):
+            interface = self.public_ip_config.get("interface")
+            ip = interface_public_ip(interface, record_type)
+            if ip is not None:
+                logger.info("获取网卡 %s 公网IP地址完成 %s", interface, ip)
+                return ip
+            if source == "interface":
+                logger.error("网卡 %s 无可用公网IP地址(%s)", interface, record_type)
+                return None
+            logger.info("网卡 %s 无可用公网IP地址(%s), 使用检测链接", interface, record_type)
+        return self.fetch_http_ip(record_type)
 
-        if ip_a == ip_b:
-            logger.info(f"获取公网IP地址完成 {ip_a}")
-            return ip_a
+    def fetch_http_ip(self, record_type: str = "A"):
+        logger.info("获取当前公网IP地址(%s)...", record_type)
+
+        if record_type == "AAAA":
+            urls = self.public_ip_config.get(
+                "urls_v6", ["https://ipv6.icanhazip.com/"]
+            )
         else:
-            logger.error(f"公网IP存在异常，[{urls[0]}]{ip_a} != [{urls[1]}]{ip_b}")
-            return None
+            urls = self.public_ip_config.get(
+                "urls", ["https://checkip.amazonaws.com/"]
+            )
+        timeout = self.public_ip_config.get("timeout", 5)
+        # 达到 quorum 个来源结果一致即返回
+        quorum = max(1, min(self.public_ip_config.get("quorum", 2), len(urls)))
+        # 按健康评分优先选择快速可用的来源
+        urls = self.source_health.rank(
+            urls, self.public_ip_config.get("fanout", 0), quorum
+        )
+
+        # 并发请求全部来源, 守护线程不阻塞返回及进程退出
+        self.get_http_session(record_type)
+        results = queue.Queue()
+        for url in urls:
+            threading.Thread(
+                target=in_log_context(self.probe_ip),
+                args=(
+                    url,
+                    record_type,
+                    timeout,
+                    results,
+                    self.source_health.start(url, timeout),
+                ),
+                daemon=True,
+            ).start()
+
+        votes = {}
+        deadline = time.monotonic() + timeout
+        for _ in urls:
+            try:
+                url, ip, error = results.get(
+                    timeout=max(0.0, deadline - time.monotonic())
+                )
+            except queue.Empty:
+                logger.error("请求超时, %ss 内未达到 %s 个来源一致", timeout, quorum)
+                break
+            if error is not None:
+                logger.error("请求错误 [%s], %s", url, error)
+                continue
+            votes.setdefault(ip, []).append(url)
+            if len(votes[ip]) >= quorum:
+                logger.info("获取公网IP地址完成 %s", ip)
+                return ip
+
+        logger.error("公网IP存在异常，%s", votes)
+        return None
 
     def create_client(self):
+        if self.dns_transport == "slim":
+            from slim import AlidnsClient
+
+            return AlidnsClient(
+                self.access_key_id,
+                self.access_key_secret,
+                self.dns_end_point,
+                self.dns_protocol,
+                max_connections=self.api_config.get("concurrency", 8),
+            )
+
+        from alibabacloud_alidns20150109.client import Client as Alidns20150109Client
+        from alibabacloud_tea_openapi import models as open_api_models
+        from alibabacloud_tea_util import models as util_models
+
+        if self.runtime is None:
+            self.runtime = util_models.RuntimeOptions()
         config = open_api_models.Config(
             access_key_id=self.access_key_id,
             access_key_secret=self.access_key_secret,
             endpoint=self.dns_end_point,
+            protocol=self.dns_protocol,
         )
         return Alidns20150109Client(config)
 
-    def describe_record(self):
-        client = self.create_client()
-        describe_domain_records_request = (
-            alidns_20150109_models.DescribeDomainRecordsRequest(
-                domain_name=self.domain_name, rrkey_word=self.rr_key_word
-            )
-        )
-        runtime = util_models.RuntimeOptions()
+    def get_client(self):
+        with self.client_lock:
+            if self.client is None:
+                self.client = self.create_client()
+            return self.client
+
+    def describe_records(self, domain_name: str, record: Record = None):
+        """
+        分页查询域名下的远程记录, 返回以 (RR, Type, Line) 为键的索引
+        指定 record 时按主机记录与类型过滤, 否则拉取整个域名
+        """
+        client = self.get_client()
+        page_size = self.page_size
+        page_number = 1
+        index = {}
         try:
-            response = client.describe_domain_records_with_options(
-                describe_domain_records_request, runtime
-            )
-            response_json = json.loads(UtilClient.to_jsonstring(response))
-            record_value = jsonpath(response_json, "$...Value")[0]
-            self.remote_record_id = jsonpath(response_json, "$...RecordId")[0]
-            return record_value
+            while True:
+                remote_records, total_count = self.describe_page(
+                    client, domain_name, page_number, page_size, record
+                )
+                for remote_record in remote_records:
+                    # RRKeyWord 为模糊匹配, 使用精确键索引
+                    index_key = remote_record.index_key
+                    if index_key in index:
+                        logger.debug("%s %s 存在多条记录, 使用首条", domain_name, index_key)
+                        continue
+                    index[index_key] = remote_record
+                if page_number * page_size >= total_count:
+                    break
+                page_number += 1
         except Exception as DescribeError:
             logger.error(DescribeError)
             return None
+        logger.debug("%s 查询完成, %s 页 %s 条记录", domain_name, page_number, len(index))
+        return index
+
+    def snapshot_records(self, records: list) -> dict:
+        """
+        按域名批量查询远程记录, 返回 {record.key: {"record_id", "value"}}
+        同一域名下多条记录时整域拉取一次, 避免逐条查询
+        """
+        records_by_domain = {}
+        for record in records:
+            records_by_domain.setdefault(record.domain_name, []).append(record)
+
+        remote_records = {}
+        for domain_name, domain_records in records_by_domain.items():
+            with metrics.timer("describe"):
+                if len(domain_records) == 1:
+                    index = self.describe_records(domain_name, domain_records[0])
+                else:
+                    index = self.describe_records(domain_name)
+            if index is None:
+                metrics.inc("aliyun_ddns_failures_total", phase="describe")
+                logger.error("%s 远程记录查询失败", domain_name)
+                continue
+            for record in domain_records:
+                remote_record = index.get((record.rr, record.type, record.line))
+                if remote_record is None:
+                    logger.error("%s 远程记录不存在", record)
+                    continue
+                remote_records[record.key] = {
+                    "record_id": remote_record.record_id,
+                    "value": remote_record.value,
+                }
+        return remote_records
+
+    def describe_page(
+        self, client, domain_name: str, page_number: int, page_size: int, record: Record
+    ) -> tuple:
+        """查询一页远程记录, 返回 (记录列表, 记录总数)"""
+        rr = record.rr if record is not None else None
+        record_type = record.type if record is not None else None
+        if self.dns_transport == "slim":
+            body = self.call_api(
+                "DescribeDomainRecords",
+                client.call,
+                "DescribeDomainRecords",
+                {
+                    "DomainName": domain_name,
+                    "PageNumber": page_number,
+                    "PageSize": page_size,
+                    "RRKeyWord": rr,
+                    "TypeKeyWord": record_type,
+                },
+            )
+            return decode_records_body(body)
 
-    def update_record(self, record_value: str):
-        client = self.create_client()
-        update_domain_record_request = alidns_20150109_models.UpdateDomainRecordRequest(
-            record_id=self.remote_record_id,
-            rr=self.rr_key_word,
-            type=self.type_key_word,
-            value=record_value,
+        from alibabacloud_alidns20150109 import models as alidns_20150109_models
+
+        describe_domain_records_request = alidns_20150109_models.DescribeDomainRecordsRequest(
+            domain_name=domain_name,
+            page_number=page_number,
+            page_size=page_size,
+            rrkey_word=rr,
+            type_key_word=record_type,
+        )
+        response = self.call_api(
+            "DescribeDomainRecords",
+            client.describe_domain_records_with_options,
+            describe_domain_records_request,
+            self.runtime,
         )
-        runtime = util_models.RuntimeOptions()
+        return decode_records(response)
+
+    def update_record(self, record: Record, record_id: str, record_value: str):
+        client = self.get_client()
         try:
-            client.update_domain_record_with_options(
-                update_domain_record_request, runtime
-            )
+            if self.dns_transport == "slim":
+                self.call_api(
+                    "UpdateDomainRecord",
+                    client.call,
+                    "UpdateDomainRecord",
+                    {
+                        "RecordId": record_id,
+                        "RR": record.rr,
+                        "Type": record.type,
+                        "Value": record_value,
+                        # 未指定线路时API按默认线路更新
+                        "Line": record.line,
+                    },
+                )
+            else:
+                from alibabacloud_alidns20150109 import models as alidns_20150109_models
+
+                update_domain_record_request = (
+                    alidns_20150109_models.UpdateDomainRecordRequest(
+                        record_id=record_id,
+                        rr=record.rr,
+                        type=record.type,
+                        value=record_value,
+                        line=record.line,
+                    )
+                )
+                self.call_api(
+                    "UpdateDomainRecord",
+                    client.update_domain_record_with_options,
+                    update_domain_record_request,
+                    self.runtime,
+                )
             return True
         except Exception as UpdateError:
+            if classify_error(UpdateError)[0] == "DomainRecordDuplicate":
+                # 远程记录已是该值
+                logger.info("%s 远程记录已是 %s", record, record_value)
+                return True
             logger.error(UpdateError)
             return False
 
-    def send_mail(self, header: str, msg: str):
-        if self.smtp_config.get("ssl") is True:
-            smtp = smtplib.SMTP_SSL(
-                self.smtp_config.get("host"), self.smtp_config.get("port")
+    def call_api(self, action: str, func, *args):
+        """
+        限流后调用阿里云API, 可重试的错误按带抖动的指数退避重试
+        """
+        retries = self.api_config.get("retries", 4)
+        backoff = self.api_config.get("backoff", 0.5)
+        max_backoff = self.api_config.get("max_backoff", 30)
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                return func(*args)
+            except Exception as ApiError:
+                code, retryable = classify_error(ApiError)
+                if not retryable or attempt >= retries:
+                    raise
+                delay = min(max_backoff, backoff * 2**attempt) * random.uniform(0.5, 1.5)
+                attempt += 1
+                metrics.inc("aliyun_ddns_api_retries_total", action=action)
+                logger.warning(
+                    "%s 请求失败 %s, %.2fs 后第 %s 次重试",
+                    action,
+                    code,
+                    delay,
+                    attempt,
+                )
+                time.sleep(delay)
+
+    def change_record(self, change: dict) -> Record:
+        return self.records_by_key.get(change["record"]) or Record(
+            change["domain_name"], change["rr"], change["type"], change["line"]
+        )
+
+    def apply_change(self, change: dict) -> bool:
+        """执行单条变更, 成功后更新本地状态"""
+        with log_context(record=change["record"]):
+            with metrics.timer("update"):
+                updated = self.update_record(
+                    self.change_record(change), change["record_id"], change["new"]
+                )
+            return self.finish_change(change, updated)
+
+    def finish_change(
+        self, change: dict, updated: bool, action: str = "UpdateDomainRecord"
+    ) -> bool:
+        """记录变更结果并发送通知, 成功后更新本地状态"""
+        record = self.change_record(change)
+        old, new = change["old"], change["new"]
+        metrics.inc(
+            "aliyun_ddns_updates_total",
+            status="success" if updated else "failure",
+            reason=change.get("reason", "unknown"),
+        )
+        if updated is False:
+            metrics.inc("aliyun_ddns_failures_total", phase="update")
+            self.notifier.notify(
+                f"[FAIL]{action}",
+                f"{record.rr}.{record.domain_name} {old} --X {new}",
+                targets=record.notify,
+                record=record.key,
+                old=old,
+                new=new,
+                status="FAIL",
             )
+            logger.error("%s 更改失败", record)
+            return False
+
+        self.notifier.notify(
+            f"[PASS]{action}",
+            f"{record.rr}.{record.domain_name} {old} --> {new}",
+            targets=record.notify,
+            record=record.key,
+            old=old,
+            new=new,
+            status="PASS",
+        )
+        self.state.put(record.key, change["record_id"], new, time.time())
+        if change.get("reason") == "drift":
+            metrics.inc("aliyun_ddns_drift_fixes_total")
+        logger.info("%s 更改成功", record)
+        return True
+
+    def apply(self, changes: list) -> int:
+        """
+        执行变更, 返回成功数量
+        同一域名的变更不少于 api.batch_threshold 条时先批量更新, 其余及批量失败的变更逐条并发更新
+        """
+        if not changes:
+            return 0
+        start = time.monotonic()
+        succeeded = 0
+        remaining = changes
+        threshold = self.api_config.get("batch_threshold", 0)
+        batch_type = self.api_config.get("batch_type")
+        if threshold > 0 and batch_type and not self.batch_unavailable:
+            changes_by_domain = {}
+            for change in changes:
+                changes_by_domain.setdefault(change["domain_name"], []).append(change)
+            remaining = []
+            batches = []
+            for domain_name, domain_changes in changes_by_domain.items():
+                if len(domain_changes) < threshold:
+                    remaining += domain_changes
+                else:
+                    batches.append((domain_name, domain_changes))
+            # 各域名的批量任务并发提交
+            concurrency = max(1, min(self.api_config.get("concurrency", 8), len(batches) or 1))
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = executor.map(
+                    in_log_context(lambda batch: self.apply_batch(*batch)), batches
+                )
+                for (_, domain_changes), applied in zip(batches, results):
+                    succeeded += len(applied)
+                    remaining += [
+                        change for change in domain_changes if change["record"] not in applied
+                    ]
+
+        if remaining:
+            concurrency = max(1, min(self.api_config.get("concurrency", 8), len(remaining)))
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                succeeded += sum(executor.map(in_log_context(self.apply_change), remaining))
+        logger.info(
+            "执行完成, 成功 %s/%s 条, 耗时 %.3fs",
+            succeeded,
+            len(changes),
+            time.monotonic() - start,
+        )
+        return succeeded
+
+    def apply_batch(self, domain_name: str, changes: list) -> set:
+        """
+        OperateBatchDomain 批量更新同一域名的记录并等待任务完成, 返回成功的记录键
+        批量接口不可用(如账号无权限、不支持的操作类型)时本进程内不再尝试
+        """
+        batch_type = self.api_config["batch_type"]
+        batch_size = self.api_config.get("batch_size", 100)
+        details = []
+        start = time.monotonic()
+        try:
+            for i in range(0, len(changes), batch_size):
+                task_id = self.operate_batch(batch_type, changes[i : i + batch_size])
+                logger.debug("%s 批量更新任务 %s 已提交", domain_name, task_id)
+                details += self.wait_batch(task_id, batch_type)
+        except Exception as BatchError:
+            code, retryable = classify_error(BatchError)
+            if not retryable:
+                self.batch_unavailable = True
+            logger.warning("%s 批量更新失败 %s, 改为逐条更新, %s", domain_name, code, BatchError)
+        metrics.observe(
+            "aliyun_ddns_phase_duration_seconds", time.monotonic() - start, phase="batch"
+        )
+        succeeded_keys = {
+            (
+                detail.get("Domain"),
+                detail.get("NewRr") or detail.get("Rr"),
+                detail.get("Type"),
+                detail.get("Line") or "default",
+                detail.get("NewValue"),
+            )
+            for detail in details
+            if detail.get("Status") in (True, "true", "SUCCESS")
+        }
+
+        applied = set()
+        for change in changes:
+            key = (domain_name, change["rr"], change["type"], change["line"], change["new"])
+            if key in succeeded_keys:
+                with log_context(record=change["record"]):
+                    self.finish_change(change, True, "OperateBatchDomain")
+                applied.add(change["record"])
+        if details:
+            logger.info(
+                "%s 批量更新完成, 成功 %s/%s 条",
+                domain_name,
+                len(applied),
+                len(changes),
+            )
+        return applied
+
+    def operate_batch(self, batch_type: str, changes: list) -> int:
+        """提交批量更新任务, 返回任务ID"""
+        client = self.get_client()
+        infos = [
+            {
+                "Domain": change["domain_name"],
+                "Rr": change["rr"],
+                "Type": change["type"],
+                "Value": change["old"],
+                "Line": change["line"],
+                "NewRr": change["rr"],
+                "NewType": change["type"],
+                "NewValue": change["new"],
+            }
+            for change in changes
+        ]
+        if self.dns_transport == "slim":
+            query = {"Type": batch_type}
+            for i, info in enumerate(infos, 1):
+                for name, value in info.items():
+                    query[f"DomainRecordInfo.{i}.{name}"] = value
+            body = self.call_api("OperateBatchDomain", client.call, "OperateBatchDomain", query)
+            return body["TaskId"]
+
+        from alibabacloud_alidns20150109 import models as alidns_20150109_models
+
+        operate_batch_domain_request = alidns_20150109_models.OperateBatchDomainRequest(
+            type=batch_type,
+            domain_record_info=[
+                alidns_20150109_models.OperateBatchDomainRequestDomainRecordInfo().from_map(info)
+                for info in infos
+            ],
+        )
+        response = self.call_api(
+            "OperateBatchDomain",
+            client.operate_batch_domain_with_options,
+            operate_batch_domain_request,
+            self.runtime,
+        )
+        return response.body.task_id
+
+    def describe_batch(self, action: str, query: dict) -> dict:
+        """查询批量任务, 返回响应体"""
+        client = self.get_client()
+        if self.dns_transport == "slim":
+            return self.call_api(action, client.call, action, query)
+
+        from alibabacloud_alidns20150109 import models as alidns_20150109_models
+
+        if action == "DescribeBatchResultCount":
+            request = alidns_20150109_models.DescribeBatchResultCountRequest().from_map(query)
+            func = client.describe_batch_result_count_with_options
         else:
-            smtp = smtplib.SMTP(
-                self.smtp_config.get("host"), self.smtp_config.get("port")
+            request = alidns_20150109_models.DescribeBatchResultDetailRequest().from_map(query)
+            func = client.describe_batch_result_detail_with_options
+        return self.call_api(action, func, request, self.runtime).body.to_map()
+
+    def wait_batch(self, task_id: int, batch_type: str) -> list:
+        """
+        轮询批量任务直至完成, 返回各记录的执行结果
+        超过 api.batch_timeout 未完成时返回已有结果, 其余记录逐条更新
+        """
+        deadline = time.monotonic() + self.api_config.get("batch_timeout", 60)
+        delay = 0.5
+        while True:
+            count = self.describe_batch(
+                "DescribeBatchResultCount", {"TaskId": task_id, "BatchType": batch_type}
+            )
+            # Status: 0 执行中, 1 已完成, -1 失败
+            if count.get("Status") != 0:
+                break
+            if time.monotonic() + delay > deadline:
+                logger.warning("批量任务 %s 未在限定时间内完成", task_id)
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, 5)
+
+        details = []
+        page_number = 1
+        while True:
+            body = self.describe_batch(
+                "DescribeBatchResultDetail",
+                {"TaskId": task_id, "BatchType": batch_type, "PageNumber": page_number, "PageSize": 100},
+            )
+            details += (body.get("BatchResultDetails") or {}).get("BatchResultDetail") or []
+            if page_number * 100 >= (body.get("TotalCount") or 0):
+                break
+            page_number += 1
+        return details
+
+    @log_cycle
+    def run(self):
+        if not self.state.acquire():
+            logger.warning("%s 已被其他实例锁定, 跳过此次运行", self.state.lock_path)
+            return
+        start = time.time()
+        try:
+            with metrics.timer("run"):
+                logger.debug("正在读取 %s", self.state.path)
+                self.state.load()
+                logger.debug("读取完成 %s 条记录", len(self.state.records))
+                if not self.hold_lease():
+                    self.follow()
+                    return
+                with metrics.timer("plan"):
+                    plan = self.plan()
+                if plan is not None:
+                    self.report_ips(plan["current_ips"])
+                    with metrics.timer("apply"):
+                        succeeded = self.apply(plan["changes"])
+                    if succeeded == len(plan["changes"]):
+                        metrics.set("aliyun_ddns_last_success_timestamp_seconds", time.time())
+                self.state.save()
+                self.source_health.save()
+        finally:
+            self.state.release()
+            metrics.set("aliyun_ddns_last_run_timestamp_seconds", start)
+            self.export_metrics()
+
+    def hold_lease(self) -> bool:
+        """获取或续约租约, 未启用多节点协调时总是返回 True"""
+        if self.lease is None:
+            return True
+        try:
+            with self.lease_lock:
+                leader = self.lease.acquire()
+            self.lease_error = False
+        except Exception as LeaseError:
+            self.lease_error = True
+            leader = self.coordination_config.get("on_error", "follower") == "leader"
+            logger.error(
+                "租约 %s 获取失败, 按%s节点运行, %s",
+                self.lease,
+                "主" if leader else "从",
+                LeaseError,
             )
+        if leader != self.is_leader:
+            if leader:
+                logger.info("已获取租约 %s, 成为主节点", self.lease)
+            else:
+                logger.info("租约 %s 由 %s 持有, 成为从节点", self.lease, self.lease.holder)
+        self.is_leader = leader
+        metrics.set("aliyun_ddns_leader", int(leader))
+        return leader
+
+    def release_lease(self, lease):
+        """主动释放租约, 从节点无需等待租约过期"""
         try:
-            smtp.login(
-                self.smtp_config.get("username"), self.smtp_config.get("password")
+            with self.lease_lock:
+                lease.release()
+            logger.info("已释放租约 %s", lease)
+        except Exception as LeaseError:
+            logger.error("释放租约失败, %s", LeaseError)
+
+    def follow(self):
+        """
+        从节点只检测并上报公网IP, 不调用云解析API
+        租约由其他节点持有时清空本地记录状态, 成为主节点后重新查询远程记录, 不使用过期的缓存;
+        租约获取失败(如 Redis 暂时不可用)时记录未被其他节点更新, 保留本地记录状态
+        """
+        current_ips = self.fetch_current_ips()
+        self.report_ips(current_ips)
+        if self.lease_error:
+            logger.info("租约获取失败, 当前IP %s, 不更新记录", current_ips)
+        else:
+            logger.info(
+                "从节点, 主节点为 %s, 当前IP %s, 不更新记录", self.lease.holder, current_ips
             )
-        except Exception as SmtpLoginError:
-            logger.error(SmtpLoginError)
+        if self.state.records and not self.lease_error:
+            self.state.records = {}
+            self.state.dirty = True
+        self.state.save()
+        self.source_health.save()
+
+    def report_ips(self, current_ips: dict):
+        """上报本节点观察到的IP, 主节点检查各节点的IP是否一致"""
+        if self.lease is None:
             return
-        message = MIMEText(msg, "plain", "utf-8")
-        message["From"] = Header(self.smtp_config.get("from_address"), "utf-8")
-        message["Subject"] = Header(header, "utf-8")
-        for address in self.smtp_config.get("to_addresses"):
-            message["To"] = Header(address, "utf-8")
-            smtp.sendmail(
-                self.smtp_config.get("username"), address, message.as_string()
+        now = time.time()
+        try:
+            self.lease.report(
+                {"time": now, "ips": current_ips, "leader": self.is_leader}
             )
-        smtp.quit()
-        return
+            if not self.is_leader:
+                return
+            # 超过两个租约周期及检查间隔未上报的节点视为离线
+            stale_after = 2 * max(self.lease.ttl, self.daemon_config.get("interval", 600))
+            for node_id, observation in self.lease.observations().items():
+                if node_id == self.lease.node_id or now - observation.get("time", 0) > stale_after:
+                    continue
+                for record_type, ip in (observation.get("ips") or {}).items():
+                    if ip is not None and current_ips.get(record_type) not in (None, ip):
+                        logger.warning(
+                            "节点 %s 观察到的IP(%s) %s 与本节点 %s 不一致",
+                            node_id,
+                            record_type,
+                            ip,
+                            current_ips.get(record_type),
+                        )
+        except Exception as ReportError:
+            logger.error("上报IP失败, %s", ReportError)
 
-    def run(self):
-        logger.debug(f"正在读取 {self.temp_data_file}")
-        temp_data = self.parse_temp_data()
+    def keep_lease(self):
+        """
+        常驻运行时每 ttl/3 续约, 主节点失效后租约过期,
+        从节点在 ttl 内获取租约并立即检查, 不等待下次检查间隔
+        """
+        while not self.stop_requested:
+            if self.lease is not None:
+                was_leader = self.is_leader
+                if self.hold_lease() and not was_leader:
+                    self.wakeup.set()
+                time.sleep(max(1.0, self.lease.ttl / 3))
+            else:
+                time.sleep(1)
+
+    def export_metrics(self):
+        """配置 metrics.textfile 时写入指标文件"""
+        textfile = self.metrics_config.get("textfile")
+        if not textfile:
+            return
+        try:
+            metrics.write_textfile(Path(textfile).expanduser())
+        except OSError as MetricsError:
+            logger.error("写入指标文件失败, %s", MetricsError)
 
-        current_ip = self.fetch_current_ip()
+    def start_metrics_server(self):
+        """常驻运行时在 metrics.listen 提供 /metrics"""
+        listen = self.metrics_config.get("listen")
+        if not listen:
+            return
+        host, _, port = str(listen).rpartition(":")
+        host = host.strip("[]") or "0.0.0.0"
+        try:
+            server = create_metrics_server(host, int(port))
+        except (OSError, ValueError) as ListenError:
+            logger.error("指标服务监听 %s 失败, %s", listen, ListenError)
+            return
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.info("指标服务已启动 http://%s/metrics", listen)
+
+    @log_cycle
+    def print_plan(self):
+        """只计算变更并输出 JSON, 不调用写入API, 不保存本地状态"""
+        self.state.load()
+        plan = self.plan()
+        if plan is None:
+            sys.exit(1)
+        print(json.dumps(plan, ensure_ascii=False, indent=2))
 
-        if current_ip is None:
+    @log_cycle
+    def apply_plan_file(self, plan_file: str):
+        """执行 --plan 输出的变更"""
+        if plan_file == "-":
+            plan = json.load(sys.stdin)
+        else:
+            with open(plan_file, "r", encoding="utf-8") as f:
+                plan = json.load(f)
+        # 合并的计划文件中同一记录有多条变更时只执行最后一条
+        changes = list({change["record"]: change for change in plan.get("changes") or []}.values())
+        if not self.state.acquire():
+            logger.error("%s 已被其他实例锁定", self.state.lock_path)
+            sys.exit(1)
+        try:
+            self.state.load()
+            if not self.hold_lease():
+                logger.error("租约由 %s 持有, 只有主节点可以执行变更", self.lease.holder)
+                sys.exit(1)
+            with metrics.timer("apply"):
+                succeeded = self.apply(changes)
+            self.state.save()
+        finally:
+            self.state.release()
+            self.export_metrics()
+        if succeeded != len(changes):
+            sys.exit(1)
+
+    def plan(self):
+        """
+        获取公网IP并比对远程记录, 返回需要执行的变更, 不调用写入API
+        获取公网IP失败时返回 None
+        """
+        start = time.monotonic()
+        if not self.records:
+            logger.error("未配置解析记录")
+            return None
+        current_ips = self.fetch_current_ips()
+
+        if all(current_ip is None for current_ip in current_ips.values()):
             logger.error("当前IP获取失败，跳过此次运行")
-            return
+            return None
 
-        if temp_data is None:
-            logger.debug("内容为空")
-            remote_ip = self.describe_record()
-
-            if remote_ip != current_ip:
-                logger.info("当前IP与远程记录IP不一致，将更改")
-                update_result = self.update_record(current_ip)
-                if update_result is False:
-                    self.send_mail(
-                        "[FAIL]UpdateDomainRecord",
-                        f"{self.rr_key_word}.{self.domain_name} {remote_ip} --X {current_ip}",
+        # 新IP未确认前不更新该类型的记录
+        held = self.debounce_ips(current_ips)
+
+        # 无本地状态及校验过期的记录批量查询远程记录
+        now = time.time()
+        unknown_records, stale_records = [], []
+        for record in self.records:
+            if current_ips.get(record.type) is None or record.type in held:
+                continue
+            cached = self.state.get(record.key)
+            if cached is None:
+                unknown_records.append(record)
+            elif self.verify_expired(record, cached, now):
+                stale_records.append(record)
+        # 每次运行最多校验 verify_batch 条, 优先校验时间最早的记录
+        stale_records.sort(key=lambda r: self.state.get(r.key).get("verified_at") or 0)
+        stale_records = stale_records[: self.state_config.get("verify_batch", 100)]
+
+        remote_records = {}
+        if unknown_records or stale_records:
+            logger.debug(
+                "%s 条记录无本地状态, %s 条记录校验过期, 查询远程记录",
+                len(unknown_records),
+                len(stale_records),
+            )
+            remote_records = self.snapshot_records(unknown_records + stale_records)
+        verified_at = time.time()
+
+        changes = []
+        for record in self.records:
+            with log_context(record=record.key):
+                current_ip = current_ips.get(record.type)
+                if current_ip is None:
+                    logger.error("%s 当前IP获取失败，跳过", record)
+                    continue
+                if record.type in held:
+                    continue
+
+                cached = self.state.get(record.key)
+                remote = remote_records.get(record.key)
+                known = remote if remote is not None else cached
+                if known is None:
+                    continue
+
+                reason = "ip_changed"
+                if cached is None:
+                    reason = "new_record"
+                elif remote is not None and (
+                    cached["value"] != remote["value"]
+                    or cached["record_id"] != remote["record_id"]
+                ):
+                    reason = "drift"
+                    logger.warning(
+                        "%s 远程记录已被修改, 本地 %s 远程 %s",
+                        record,
+                        cached["value"],
+                        remote["value"],
                     )
-                    logger.error("更改失败")
-                else:
-                    self.send_mail(
-                        "[PASS]UpdateDomainRecord",
-                        f"{self.rr_key_word}.{self.domain_name} {remote_ip} --> {current_ip}",
+                if remote is not None:
+                    self.state.put(
+                        record.key, remote["record_id"], remote["value"], verified_at
                     )
-                    logger.info("更改成功")
+
+                if known["value"] == current_ip:
+                    logger.info("%s 当前IP与远程记录IP一致", record)
+                    continue
+
+                logger.info("%s 当前IP与远程记录IP不一致，将更改", record)
+                changes.append(
+                    {
+                        "record": record.key,
+                        "domain_name": record.domain_name,
+                        "rr": record.rr,
+                        "type": record.type,
+                        "line": record.line,
+                        "record_id": known["record_id"],
+                        "old": known["value"],
+                        "new": current_ip,
+                        "reason": reason,
+                    }
+                )
+
+        logger.info("计划完成, %s 条变更, 耗时 %.3fs", len(changes), time.monotonic() - start)
+        return {"current_ips": current_ips, "held": held, "changes": changes}
+
+    def fetch_current_ips(self) -> dict:
+        """每种记录类型只获取一次公网IP, IPv4 与 IPv6 并发获取"""
+        record_types = sorted({record.type for record in self.records})
+        if not record_types:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(record_types)) as executor:
+            return dict(
+                zip(
+                    record_types,
+                    executor.map(in_log_context(self.fetch_current_ip), record_types),
+                )
+            )
+
+    def debounce_ips(self, current_ips: dict) -> dict:
+        """
+        新IP需连续 debounce.probes 次检测一致且持续 debounce.window 秒后才确认,
+        返回 {记录类型: 待确认信息}, 待确认的类型本次不更新
+        确认前IP再次变化时只保留最新的IP, 被跳过的变化写入状态文件的 audit
+        """
+        probes = self.debounce_config.get("probes", 1)
+        window = self.debounce_config.get("window", 0)
+        now = time.time()
+        held = {}
+        for record_type, ip in current_ips.items():
+            if ip is None:
+                continue
+            entry = self.state.debounce.get(record_type) or {}
+            pending = entry.get("pending")
+            if ip == entry.get("stable"):
+                if pending is not None:
+                    # IP在确认前恢复
+                    self.audit_transition(record_type, pending, "reverted", ip, now)
+                    entry["pending"] = None
+                    self.state.dirty = True
+                continue
+
+            if pending is not None and pending["ip"] != ip:
+                self.audit_transition(record_type, pending, "superseded", ip, now)
+                pending = None
+            if pending is None:
+                pending = {"ip": ip, "first_seen": now, "probes": 0}
+            pending["probes"] += 1
+
+            # 首次运行无已确认IP, 直接确认
+            if entry.get("stable") is None or (
+                pending["probes"] >= probes and now - pending["first_seen"] >= window
+            ):
+                if entry.get("stable") is not None:
+                    logger.info(
+                        "新IP %s(%s) 已确认, %s 次检测, 持续 %.0fs",
+                        ip,
+                        record_type,
+                        pending["probes"],
+                        now - pending["first_seen"],
+                    )
+                self.state.debounce[record_type] = {"stable": ip, "pending": None}
             else:
-                logger.info("当前IP与远程记录IP一致")
-            self.save_temp_data(current_ip)
+                logger.info(
+                    "新IP %s(%s) 待确认, 已检测 %s/%s 次, 持续 %.0f/%ss, 暂不更新",
+                    ip,
+                    record_type,
+                    pending["probes"],
+                    probes,
+                    now - pending["first_seen"],
+                    window,
+                )
+                self.state.debounce[record_type] = {
+                    "stable": entry.get("stable"),
+                    "pending": pending,
+                }
+                held[record_type] = pending
+            self.state.dirty = True
+        return held
+
+    def audit_transition(self, record_type: str, pending: dict, outcome: str, by: str, now: float):
+        """记录未确认即被跳过的IP变化"""
+        logger.info("IP %s(%s) 未确认即变为 %s, 已跳过", pending["ip"], record_type, by)
+        metrics.inc("aliyun_ddns_skipped_transitions_total", type=record_type, outcome=outcome)
+        self.state.audit.append(
+            {
+                "time": now,
+                "type": record_type,
+                "ip": pending["ip"],
+                "first_seen": pending["first_seen"],
+                "probes": pending["probes"],
+                "outcome": outcome,
+                "by": by,
+            }
+        )
+        del self.state.audit[: -self.debounce_config.get("audit_limit", 100)]
+
+    def verify_expired(self, record: Record, cached: dict, now: float) -> bool:
+        """
+        本地状态是否超过校验有效期 verify_ttl
+        按记录键计算固定的抖动, 使各记录的校验时间分散
+        """
+        verify_ttl = self.state_config.get("verify_ttl", 3600)
+        if not verify_ttl:
+            return False
+        verified_at = cached.get("verified_at")
+        if verified_at is None:
+            return True
+        jitter = self.state_config.get("verify_jitter", 0.1)
+        spread = zlib.crc32(record.key.encode("utf-8")) / 0xFFFFFFFF
+        return now - verified_at > verify_ttl * (1 + jitter * spread)
+
+    def handle_signal(self, signum, frame):
+        if signum == getattr(signal, "SIGHUP", None):
+            logger.info("收到 SIGHUP, 将重新加载配置")
+            self.reload_requested = True
         else:
-            logger.debug(f"读取完成 {temp_data}")
-            temp_data_record_ip = temp_data["current_ip"]
-            self.remote_record_id = temp_data["remote_record_id"]
-
-            if current_ip != temp_data_record_ip:
-                logger.info("当前IP与远程记录IP不一致，将更改")
-                update_result = self.update_record(current_ip)
-                if update_result is False:
-                    self.send_mail(
-                        "[FAIL]UpdateDomainRecord",
-                        f"{self.rr_key_word}.{self.domain_name} {temp_data_record_ip} --X {current_ip}",
-                    )
-                    logger.error("更改失败")
+            logger.info("收到信号 %s, 将退出", signum)
+            self.stop_requested = True
+        self.wakeup.set()
+
+    def next_interval(self) -> float:
+        """
+        下次检查的等待时间, 加入随机抖动
+        监听网卡时仅作为兜底, 使用 poll_interval
+        """
+        if self.args.watch is True:
+            interval = self.daemon_config.get("poll_interval", 3600)
+        else:
+            interval = self.daemon_config.get("interval", 600)
+        if any(entry.get("pending") for entry in self.state.debounce.values()):
+            # 有待确认的新IP时缩短间隔, 尽快完成确认
+            interval = min(interval, self.debounce_config.get("recheck", 60))
+        jitter = self.daemon_config.get("jitter", 0)
+        return max(1.0, interval + random.uniform(-jitter, jitter))
+
+    def watch_interface(self):
+        """
+        订阅 rtnetlink 地址变化事件, 配置的网卡地址变化时唤醒主循环
+        套接字出错(如地址变化过多时 ENOBUFS, 事件已丢失)后按退避时间重新订阅, 并立即检查一次
+        """
+        groups = RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR
+        delay = 1
+        resync = False
+        while not self.stop_requested:
+            try:
+                with socket.socket(
+                    socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE
+                ) as sock:
+                    sock.bind((0, groups))
+                    if resync:
+                        logger.info(
+                            "已重新监听网卡 %s 地址变化", self.public_ip_config.get("interface")
+                        )
+                        resync = False
+                        delay = 1
+                        self.address_changed = True
+                        self.wakeup.set()
+                    while not self.stop_requested:
+                        self.handle_address_events(sock.recv(65536))
+            except Exception as WatchError:
+                if isinstance(WatchError, OSError) and WatchError.errno == errno.ENOBUFS:
+                    logger.warning("网卡地址变化事件过多, 部分事件已丢失, 重新监听")
                 else:
-                    self.send_mail(
-                        "[PASS]UpdateDomainRecord",
-                        f"{self.rr_key_word}.{self.domain_name} {temp_data_record_ip} --> {current_ip}",
-                    )
-                    self.save_temp_data(current_ip)
-                    logger.info("更改成功")
-            else:
-                logger.info("当前IP与远程记录IP一致")
+                    logger.error("监听网卡地址变化失败, %ss 后重试, %s", delay, WatchError)
+                    time.sleep(delay)
+                    delay = min(delay * 2, 300)
+                resync = True
+
+    def handle_address_events(self, data: bytes):
+        interface = self.public_ip_config.get("interface")
+        for msg_type, index, address, _ in parse_addr_messages(data):
+            if msg_type not in (RTM_NEWADDR, RTM_DELADDR):
+                continue
+            # 重新拨号后网卡序号会变化, 按名称匹配
+            try:
+                if socket.if_indextoname(index) != interface:
+                    continue
+            except OSError:
+                continue
+            action = "新增" if msg_type == RTM_NEWADDR else "删除"
+            logger.info("网卡 %s %s地址 %s", interface, action, address)
+            self.address_changed = True
+            self.wakeup.set()
+
+    def serve_forever(self):
+        for signum in ("SIGHUP", "SIGTERM", "SIGINT"):
+            if hasattr(signal, signum):
+                signal.signal(getattr(signal, signum), self.handle_signal)
+
+        if self.args.watch is True:
+            if not self.public_ip_config.get("interface"):
+                logger.error("监听网卡需配置 public_ip.interface")
+                return
+            threading.Thread(target=self.watch_interface, daemon=True).start()
+            logger.info(
+                "监听网卡 %s 地址变化, 兜底检查间隔 %ss",
+                self.public_ip_config.get("interface"),
+                self.daemon_config.get("poll_interval", 3600),
+            )
+        else:
+            logger.info("常驻运行, 检查间隔 %ss", self.daemon_config.get('interval', 600))
+        self.start_metrics_server()
+        if self.lease is not None:
+            threading.Thread(target=self.keep_lease, daemon=True).start()
+        while not self.stop_requested:
+            if self.reload_requested:
+                self.reload_requested = False
+                try:
+                    self.load_config()
+                    logger.info("%s 重新加载完成", self.config_file)
+                except Exception as ReloadError:
+                    logger.error("重新加载配置失败, 继续使用原配置, %s", ReloadError)
+
+            try:
+                self.run()
+            except Exception as RunError:
+                logger.exception(RunError)
+
+            self.wakeup.wait(self.next_interval())
+            self.wakeup.clear()
+            if self.address_changed:
+                # 等待地址变化的后续事件, 合并为一次检查
+                time.sleep(self.daemon_config.get("settle", 0.5))
+                self.address_changed = False
+                self.wakeup.clear()
+        if self.lease is not None and self.is_leader:
+            self.release_lease(self.lease)
+        logger.info("已退出")
 
 
 if __name__ == "__main__":
     service = AliyunDDNS()
-    service.run()
+    try:
+        if service.args.plan is True:
+            service.print_plan()
+        elif service.args.apply is not None:
+            service.apply_plan_file(service.args.apply)
+        elif service.args.daemon is True or service.args.watch is True:
+            service.serve_forever()
+        else:
+            service.run()
+    finally:
+        service.source_health.close()
+        service.notifier.close()
+        close_logging()
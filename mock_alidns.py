@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+# @File          : mock_alidns.py
+# @Description   : 本地模拟阿里云云解析API, 校验 ACS3-HMAC-SHA256 签名, 记录保存在内存中。
+#                  支持 DescribeDomainRecords / UpdateDomainRecord 及 OperateBatchDomain 批量任务
+#                  用于联调及基准测试, 用法参见 `python3 mock_alidns.py -h`
+
+import argparse
+import datetime
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from slim import Utils
+
+SIGNATURE_ALGORITHM = "ACS3-HMAC-SHA256"
+# DescribeDomainRecords 单页上限
+MAX_PAGE_SIZE = 500
+# 请求时间允许的偏差, 单位秒
+MAX_CLOCK_SKEW = 15 * 60
+# OperateBatchDomain 文档中的解析记录操作类型, 其他类型(包括 RR_MODIFY)按云解析API返回 InvalidBatchType;
+# DOMAIN_ADD / DOMAIN_DEL 不模拟
+BATCH_TYPES = ("RR_ADD", "RR_DEL")
+
+
+class AlidnsError(Exception):
+    def __init__(self, status: int, code: str, message: str):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+class MockAlidns:
+    """
+    内存中的云解析服务
+    latency: 每个请求的附加延迟, 单位秒
+    throttle_rate: 随机返回 Throttling.User 的概率
+    qps: 服务端限流, 超过后返回 Throttling.User, 0 为不限流
+    """
+
+    def __init__(
+        self,
+        accounts: dict,
+        latency: float = 0,
+        throttle_rate: float = 0,
+        qps: float = 0,
+    ):
+        self.accounts = accounts
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.qps = qps
+        self.records = {}
+        self.nonces = set()
+        self.requests = {}
+        self.lock = threading.Lock()
+        self.next_record_id = 100000000
+        self.tasks = {}
+        self.next_task_id = 1000
+        self.window = (0, 0)
+        self.server = None
+
+    def add_record(
+        self, domain_name: str, rr: str, type: str, value: str, line: str = "default"
+    ) -> str:
+        with self.lock:
+            self.next_record_id += 1
+            record_id = str(self.next_record_id)
+            self.records[record_id] = {
+                "DomainName": domain_name,
+                "RecordId": record_id,
+                "RR": rr,
+                "Type": type,
+                "Value": value,
+                "Line": line,
+                "TTL": 600,
+                "Status": "ENABLE",
+                "Locked": False,
+                "Weight": 1,
+            }
+            return record_id
+
+    def verify_signature(self, method: str, path: str, query: dict, headers, body: bytes):
+        authorization = headers.get("Authorization") or ""
+        sign_type, _, fields = authorization.partition(" ")
+        if sign_type != SIGNATURE_ALGORITHM:
+            raise AlidnsError(400, "IncompleteSignature", "不支持的签名算法")
+        fields = dict(field.split("=", 1) for field in fields.split(",") if "=" in field)
+        access_key_id = fields.get("Credential")
+        if access_key_id not in self.accounts:
+            raise AlidnsError(404, "InvalidAccessKeyId.NotFound", "AccessKeyId 不存在")
+
+        payload = headers.get("x-acs-content-sha256")
+        if payload != hashlib.sha256(body).hexdigest():
+            raise AlidnsError(400, "IncompleteSignature", "x-acs-content-sha256 不符")
+
+        nonce = headers.get("x-acs-signature-nonce")
+        with self.lock:
+            if not nonce or nonce in self.nonces:
+                raise AlidnsError(400, "SignatureNonceUsed", "x-acs-signature-nonce 重复")
+            self.nonces.add(nonce)
+
+        try:
+            request_time = datetime.datetime.strptime(
+                headers.get("x-acs-date") or "", "%Y-%m-%dT%H:%M:%SZ"
+            ).replace(tzinfo=datetime.timezone.utc)
+        except ValueError:
+            raise AlidnsError(400, "InvalidTimeStamp.Format", "x-acs-date 格式错误")
+        skew = abs(time.time() - request_time.timestamp())
+        if skew > MAX_CLOCK_SKEW:
+            raise AlidnsError(400, "InvalidTimeStamp.Expired", "x-acs-date 已过期")
+
+        signed_headers = fields.get("SignedHeaders", "").split(";")
+        canonical_headers = "".join(
+            f"{name}:{(headers.get(name) or '').strip()}\n" for name in signed_headers
+        )
+        canonical_request = (
+            f"{method}\n"
+            f"{path}\n"
+            f"{Utils.get_canonical_query_string(query)}\n"
+            f"{canonical_headers}\n"
+            f"{';'.join(signed_headers)}\n"
+            f"{payload}"
+        )
+        str_to_sign = (
+            f"{SIGNATURE_ALGORITHM}\n"
+            f"{hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()}"
+        )
+        signature = hmac.new(
+            self.accounts[access_key_id].encode("utf-8"),
+            str_to_sign.encode("utf-8"),
+            hashlib.sha256,
+        ).hexdigest()
+        if not hmac.compare_digest(signature, fields.get("Signature", "")):
+            raise AlidnsError(400, "SignatureDoesNotMatch", "签名不匹配")
+
+    def check_throttling(self):
+        if self.throttle_rate and random.random() < self.throttle_rate:
+            raise AlidnsError(400, "Throttling.User", "Request was denied due to user flow control.")
+        if self.qps:
+            with self.lock:
+                second = int(time.monotonic())
+                window_second, count = self.window
+                count = count + 1 if window_second == second else 1
+                self.window = (second, count)
+            if count > self.qps:
+                raise AlidnsError(400, "Throttling.User", "Request was denied due to user flow control.")
+
+    def handle(self, action: str, params: dict) -> dict:
+        with self.lock:
+            self.requests[action] = self.requests.get(action, 0) + 1
+        handler = getattr(self, f"action_{action}", None)
+        if handler is None:
+            raise AlidnsError(404, "InvalidAction.NotFound", f"未知的 action: {action}")
+        return handler(params)
+
+    def action_DescribeDomainRecords(self, params: dict) -> dict:
+        domain_name = params.get("DomainName")
+        if not domain_name:
+            raise AlidnsError(400, "MissingDomainName", "DomainName is mandatory for this action.")
+        page_number = int(params.get("PageNumber", 1))
+        page_size = int(params.get("PageSize", 20))
+        if page_size > MAX_PAGE_SIZE:
+            raise AlidnsError(400, "InvalidPageSize", "PageSize 超出范围")
+        rr_key_word = params.get("RRKeyWord")
+        type_key_word = params.get("TypeKeyWord")
+        with self.lock:
+            records = [
+                dict(record)
+                for record in self.records.values()
+                if record["DomainName"] == domain_name
+                and (not rr_key_word or rr_key_word in record["RR"])
+                and (not type_key_word or type_key_word == record["Type"])
+            ]
+        start = (page_number - 1) * page_size
+        return {
+            "TotalCount": len(records),
+            "PageNumber": page_number,
+            "PageSize": page_size,
+            "DomainRecords": {"Record": records[start : start + page_size]},
+        }
+
+    def action_UpdateDomainRecord(self, params: dict) -> dict:
+        record_id = params.get("RecordId")
+        with self.lock:
+            record = self.records.get(record_id)
+            if record is None:
+                raise AlidnsError(
+                    400, "DomainRecordNotBelongToUser", "The DNS record does not exist."
+                )
+            updated = {
+                "RR": params.get("RR", record["RR"]),
+                "Type": params.get("Type", record["Type"]),
+                "Value": params.get("Value", record["Value"]),
+                # 与云解析API一致, 未指定线路时为默认线路
+                "Line": params.get("Line", "default"),
+            }
+            if all(record[key] == value for key, value in updated.items()):
+                raise AlidnsError(400, "DomainRecordDuplicate", "The DNS record already exists.")
+            record.update(updated)
+        return {"RecordId": record_id}
+
+    def action_OperateBatchDomain(self, params: dict) -> dict:
+        batch_type = params.get("Type")
+        if batch_type not in BATCH_TYPES:
+            raise AlidnsError(400, "InvalidBatchType", f"不支持的批量操作类型 {batch_type}")
+        # DomainRecordInfo.N.Field 展开的列表参数
+        infos = {}
+        for name, value in params.items():
+            parts = name.split(".")
+            if len(parts) == 3 and parts[0] == "DomainRecordInfo":
+                infos.setdefault(int(parts[1]), {})[parts[2]] = value
+        if not infos:
+            raise AlidnsError(400, "MissingDomainRecordInfo", "DomainRecordInfo is mandatory for this action.")
+
+        details = []
+        with self.lock:
+            for _, info in sorted(infos.items()):
+                details.append(self.apply_batch_info(batch_type, info))
+            self.next_task_id += 1
+            task_id = self.next_task_id
+            self.tasks[task_id] = {"type": batch_type, "details": details}
+        return {"TaskId": task_id}
+
+    def apply_batch_info(self, batch_type: str, info: dict) -> dict:
+        detail = {
+            "BatchType": batch_type,
+            "Domain": info.get("Domain"),
+            "Rr": info.get("Rr"),
+            "NewRr": info.get("NewRr"),
+            "Type": info.get("Type"),
+            "Value": info.get("Value"),
+            "NewValue": info.get("NewValue"),
+            "Line": info.get("Line", "default"),
+            "Status": False,
+            "Reason": "",
+        }
+        if batch_type == "RR_ADD":
+            self.next_record_id += 1
+            record_id = str(self.next_record_id)
+            self.records[record_id] = {
+                "DomainName": info.get("Domain"),
+                "RecordId": record_id,
+                "RR": info.get("Rr"),
+                "Type": info.get("Type"),
+                "Value": info.get("Value"),
+                "Line": info.get("Line", "default"),
+                "TTL": int(info.get("Ttl", 600)),
+                "Status": "ENABLE",
+                "Locked": False,
+                "Weight": 1,
+            }
+            detail.update(RecordId=record_id, Status=True)
+            return detail
+
+        for record_id, record in self.records.items():
+            if (
+                record["DomainName"] == info.get("Domain")
+                and record["RR"] == info.get("Rr")
+                and record["Type"] == info.get("Type")
+                and record["Value"] == info.get("Value")
+                and record["Line"] == info.get("Line", "default")
+            ):
+                break
+        else:
+            detail["Reason"] = "The DNS record does not exist."
+            return detail
+
+        del self.records[record_id]
+        detail.update(RecordId=record_id, Status=True)
+        return detail
+
+    def get_task(self, params: dict) -> dict:
+        task = self.tasks.get(int(params.get("TaskId") or 0))
+        if task is None:
+            raise AlidnsError(400, "InvalidTaskId", "The task does not exist.")
+        return task
+
+    def action_DescribeBatchResultCount(self, params: dict) -> dict:
+        task = self.get_task(params)
+        success_count = sum(1 for detail in task["details"] if detail["Status"])
+        return {
+            "TaskId": int(params["TaskId"]),
+            "BatchType": task["type"],
+            "Status": 1,
+            "TotalCount": len(task["details"]),
+            "SuccessCount": success_count,
+            "FailedCount": len(task["details"]) - success_count,
+        }
+
+    def action_DescribeBatchResultDetail(self, params: dict) -> dict:
+        task = self.get_task(params)
+        page_number = int(params.get("PageNumber", 1))
+        page_size = int(params.get("PageSize", 20))
+        start = (page_number - 1) * page_size
+        return {
+            "TotalCount": len(task["details"]),
+            "PageNumber": page_number,
+            "PageSize": page_size,
+            "BatchResultDetails": {"BatchResultDetail": task["details"][start : start + page_size]},
+        }
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """在后台线程中启动, 返回接入点 host:port"""
+        self.server = ThreadingHTTPServer((host, port), MockHandler)
+        self.server.daemon_threads = True
+        self.server.mock = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"{host}:{self.server.server_port}"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头与响应体分开写入, 避免 Nagle 与延迟确认叠加的 40ms 等待
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.do_POST()
+
+    def do_POST(self):
+        mock: MockAlidns = self.server.mock
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        url = urlsplit(self.path)
+        query = dict(parse_qsl(url.query, keep_blank_values=True))
+        request_id = str(uuid.uuid4()).upper()
+        if mock.latency:
+            time.sleep(mock.latency)
+        try:
+            mock.verify_signature(self.command, url.path or "/", query, self.headers, body)
+            mock.check_throttling()
+            params = dict(query)
+            if body and "form" in (self.headers.get("Content-Type") or ""):
+                params.update(parse_qsl(body.decode("utf-8"), keep_blank_values=True))
+            action = self.headers.get("x-acs-action") or params.get("Action")
+            status, response = 200, mock.handle(action, params)
+        except AlidnsError as error:
+            status = error.status
+            response = {"Code": error.code, "Message": error.message, "HostId": self.headers.get("Host")}
+        response["RequestId"] = request_id
+
+        data = json.dumps(response).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("x-acs-request-id", request_id)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟阿里云云解析API")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--access_key_id", type=str, default="mock-access-key-id")
+    parser.add_argument("--access_key_secret", type=str, default="mock-access-key-secret")
+    parser.add_argument("--domains", type=str, nargs="+", default=["example.com"])
+    parser.add_argument("--records", type=int, default=10, help="每个域名的A记录数量, 主机记录为 host0 ~ hostN")
+    parser.add_argument("--value", type=str, default="192.0.2.1", help="记录初始值")
+    parser.add_argument("--latency", type=float, default=0, help="每个请求的附加延迟, 单位秒")
+    parser.add_argument("--throttle_rate", type=float, default=0, help="随机限流概率")
+    parser.add_argument("--qps", type=float, default=0, help="服务端限流, 0 为不限流")
+    args = parser.parse_args()
+
+    mock = MockAlidns(
+        {args.access_key_id: args.access_key_secret},
+        latency=args.latency,
+        throttle_rate=args.throttle_rate,
+        qps=args.qps,
+    )
+    for domain_name in args.domains:
+        for i in range(args.records):
+            mock.add_record(domain_name, f"host{i}", "A", args.value)
+
+    endpoint = mock.start(args.host, args.port)
+    print(f"dns_end_point: {endpoint} (protocol: HTTP)", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -13,19 +13,20 @@ import configparser
 import datetime
 import hashlib
 import hmac
+import http.client
 import json
 import os
 import platform
+import random
 import re
-import smtplib
+import select
 import socket
 import ssl
 import sys
+import threading
 import time
 import urllib.request
 import uuid
-from email.header import Header
-from email.mime.text import MIMEText
 from typing import Any
 from urllib.parse import quote
 
@@ -56,11 +57,16 @@ class Utils:
     acs_version = "2015-01-09"
     tea_version = "0.3.0"
     signature_algorithm = "ACS3-HMAC-SHA256"
+    # 日志时间 (unix time, 可读时间), 同一秒内的日志复用
+    log_time = (None, "")
 
     def printer(self, level, *msg):
-        print(
-            f"{self.get_timestamp()} [{level}] {' '.join(self.to_str(m) for m in msg)}"
-        )
+        now = self.get_unix_time()
+        second, timestamp = self.log_time
+        if now != second:
+            timestamp = self.get_timestamp()
+            self.log_time = (now, timestamp)
+        print(f"{timestamp} [{level}] {' '.join(self.to_str(m) for m in msg)}")
 
     @staticmethod
     def get_unix_time() -> int:
@@ -200,6 +206,221 @@ class Utils:
         return auth
 
 
+class Signer:
+    """
+    ACS3-HMAC-SHA256 签名, 结果与 Utils.get_authorization 一致
+    user-agent、空请求体哈希、host 及版本等不变的规范化请求头只构造一次,
+    每次请求只计算 action、时间、nonce 及签名
+    """
+
+    # 按字母序排列的签名请求头
+    signed_headers = (
+        "accept;host;user-agent;x-acs-action;x-acs-content-sha256;"
+        "x-acs-date;x-acs-signature-nonce;x-acs-version"
+    )
+
+    def __init__(
+        self,
+        access_key_id: str,
+        access_key_secret: str,
+        end_point: str,
+        user_agent: str = None,
+    ):
+        utils = Utils()
+        self.algorithm = utils.signature_algorithm
+        self.credential = f"{self.algorithm} Credential={access_key_id},SignedHeaders="
+        self.secret = access_key_secret.encode("utf-8")
+        self.hostname = socket.gethostname()
+        # 请求头的值与 Utils.handle_headers 相同, 去除首尾空白
+        self.headers = {
+            "accept": "application/json",
+            "host": end_point.strip(),
+            "user-agent": (user_agent or utils.get_agent()).strip(),
+            "x-acs-content-sha256": hashlib.sha256(b"").hexdigest(),
+            "x-acs-version": utils.acs_version,
+        }
+        self.canonical_prefix = "".join(
+            f"{key}:{self.headers[key]}\n" for key in ("accept", "host", "user-agent")
+        )
+        self.canonical_suffix = (
+            f"\n{self.signed_headers}\n{self.headers['x-acs-content-sha256']}"
+        )
+        # 请求时间 (unix time, UTC时间), 同一秒内的请求复用
+        self.date = (None, "")
+
+    def get_date(self) -> str:
+        now = int(time.time())
+        second, date = self.date
+        if now != second:
+            date = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now))
+            self.date = (now, date)
+        return date
+
+    def get_nonce(self) -> str:
+        """与 Utils.get_nonce 相同, 使用缓存的主机名"""
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, self.hostname + str(uuid.uuid1())))
+
+    def sign(self, action: str, canonical_query: str, date: str = None, nonce: str = None) -> dict:
+        """
+        返回签名后的请求头
+        :param canonical_query: Utils.get_canonical_query_string 规范化的查询字符串
+        :param date: 请求时间, 默认当前UTC时间
+        :param nonce: 请求标识符, 默认随机生成
+        """
+        headers = self.headers
+        action = action.strip()
+        date = date or self.get_date()
+        nonce = nonce or self.get_nonce()
+        canonical_request = (
+            f"POST\n/\n{canonical_query}\n"
+            f"{self.canonical_prefix}"
+            f"x-acs-action:{action}\n"
+            f"x-acs-content-sha256:{headers['x-acs-content-sha256']}\n"
+            f"x-acs-date:{date}\n"
+            f"x-acs-signature-nonce:{nonce}\n"
+            f"x-acs-version:{headers['x-acs-version']}\n"
+            f"{self.canonical_suffix}"
+        )
+        str_to_sign = (
+            f"{self.algorithm}\n"
+            f"{hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()}"
+        )
+        signature = hmac.new(self.secret, str_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+        return {
+            "accept": headers["accept"],
+            "host": headers["host"],
+            "user-agent": headers["user-agent"],
+            "x-acs-action": action,
+            "x-acs-content-sha256": headers["x-acs-content-sha256"],
+            "x-acs-date": date,
+            "x-acs-signature-nonce": nonce,
+            "x-acs-version": headers["x-acs-version"],
+            "Authorization": (
+                f"{self.credential}{self.signed_headers},Signature={signature}"
+            ),
+        }
+
+
+class AlidnsError(Exception):
+    """云解析API返回的错误, 字段与阿里SDK异常一致"""
+
+    def __init__(self, status_code: int, code: str, message: str, request_id: str = None):
+        super().__init__(f"{code}: {message} (RequestId: {request_id})")
+        self.status_code = status_code
+        self.code = code
+        self.message = message
+        self.request_id = request_id
+
+
+class AlidnsClient:
+    """
+    使用 Signer 签名的轻量云解析客户端, 无外部依赖
+    连接保持 keep-alive 并在多线程间复用, HTTPS 校验服务端证书
+    """
+
+    def __init__(
+        self,
+        access_key_id: str,
+        access_key_secret: str,
+        end_point: str,
+        protocol: str = "HTTPS",
+        timeout: float = 10,
+        max_connections: int = 8,
+    ):
+        self.utils = Utils()
+        self.signer = Signer(access_key_id, access_key_secret, end_point)
+        self.end_point = end_point
+        self.https = protocol.upper() == "HTTPS"
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.context = ssl.create_default_context() if self.https else None
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def connect(self) -> http.client.HTTPConnection:
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                connection = self.idle.pop()
+            # 空闲连接可读说明已被服务端关闭(或有残留数据), 不再复用
+            if not select.select([connection.sock], [], [], 0)[0]:
+                return connection
+            connection.close()
+        if self.https:
+            return http.client.HTTPSConnection(
+                self.end_point, timeout=self.timeout, context=self.context
+            )
+        return http.client.HTTPConnection(self.end_point, timeout=self.timeout)
+
+    def release(self, connection: http.client.HTTPConnection):
+        with self.lock:
+            if len(self.idle) < self.max_connections:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+    def call(self, action: str, query: dict) -> dict:
+        """
+        调用 action, 返回响应体
+        :param query: 请求参数, 值为 None 的参数忽略
+        """
+        query = {key: str(value) for key, value in query.items() if value is not None}
+        canonical_query = self.utils.get_canonical_query_string(query)
+        url = f"/?{canonical_query}"
+        read_only = action.startswith("Describe")
+        for attempt in range(2):
+            connection = self.connect()
+            reused = connection.sock is not None
+            sent = False
+            try:
+                headers = self.signer.sign(action, canonical_query)
+                connection.request("POST", url, headers=headers)
+                sent = True
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                # 复用的空闲连接可能已被服务端关闭, 请求未发出或为查询时重新签名后在新连接上重试一次;
+                # 已发出的更新请求可能已被处理, 不重试, 避免重复提交(如批量任务)
+                if attempt == 0 and reused and (not sent or read_only):
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            break
+
+        if response.will_close:
+            connection.close()
+        else:
+            self.release(connection)
+
+        try:
+            body = json.loads(data) if data else {}
+        except ValueError:
+            # 网关等返回的非 JSON 响应, 按HTTP状态码判断是否可重试
+            raise AlidnsError(
+                response.status,
+                str(response.status) if response.status >= 400 else "InvalidResponse",
+                data[:200].decode("utf-8", "replace") or response.reason,
+            ) from None
+        if response.status >= 400:
+            raise AlidnsError(
+                response.status,
+                body.get("Code", str(response.status)),
+                body.get("Message", response.reason),
+                body.get("RequestId"),
+            )
+        return body
+
+
 class AliDDNS:
     work_dir = os.path.dirname(__file__)
     ini_config = configparser.ConfigParser()  # 实例化ConfigParser
@@ -224,6 +445,8 @@ class AliDDNS:
         try:
             self.pub_ip_url = self.ini_config.get("service", "pub_ip_url")
             self.end_point = self.ini_config.get("account", "end_point")
+            # 可选项, 连接本地模拟API (mock_alidns.py) 时设为 http
+            self.protocol = self.ini_config.get("account", "protocol", fallback="https")
             self.access_key_id = self.ini_config.get("account", "access_key_id")
             self.access_key_secret = self.ini_config.get("account", "access_key_secret")
             self.domain_name = self.ini_config.get("domain", "domain_name")
@@ -245,6 +468,9 @@ class AliDDNS:
         except Exception as GetConfigError:
             self.utils.printer(ERROR, "错误的配置项:", GetConfigError)
             sys.exit()
+        self.client = AlidnsClient(
+            self.access_key_id, self.access_key_secret, self.end_point, self.protocol
+        )
         self.send_list = []
         if not re.match(self.pattern, self.mail_user):
             self.utils.printer(ERROR, "错误的邮箱地址:", self.mail_user)
@@ -330,64 +556,56 @@ class AliDDNS:
         return ip
 
     def _handle_request(self, action, data=None) -> Any:
-        utils = self.utils
-        headers = {
-            "accept": "application/json",
-            "host": self.end_point,
-            "user-agent": utils.get_agent(),
-            "x-acs-date": utils.get_timestamp(utc=True),
-            "x-acs-signature-nonce": utils.get_nonce(),
-            "x-acs-version": utils.acs_version,
-        }
-        hashed_request_payload = utils.hex_encode(
-            utils.hash_bytes(b"", utils.signature_algorithm)
-        )
-        headers["x-acs-content-sha256"] = hashed_request_payload
-
-        request = Request()
-        request.headers = headers
-
         if action == UPDATE:
             record_id, value = data
-            url = f"https://{self.end_point}/?RR={self.rr_key_word}&RecordId={record_id}&Type={self.type_key_word}&Value={value}"
-            headers["x-acs-action"] = "UpdateDomainRecord"
-            request.query = {
-                "RR": self.rr_key_word,
-                "RecordId": record_id,
-                "Type": self.type_key_word,
-                "Value": value,
-            }
+            self.client.call(
+                "UpdateDomainRecord",
+                {
+                    "RR": self.rr_key_word,
+                    "RecordId": record_id,
+                    "Type": self.type_key_word,
+                    "Value": value,
+                },
+            )
         elif action == DESCRIBE:
-            url = f"https://{self.end_point}/?DomainName={self.domain_name}&RRKeyWord={self.rr_key_word}"
-            request.headers["x-acs-action"] = "DescribeDomainRecords"
-            request.query = {
-                "DomainName": self.domain_name,
-                "RRKeyWord": self.rr_key_word,
-            }
+            response = self.client.call(
+                "DescribeDomainRecords",
+                {"DomainName": self.domain_name, "RRKeyWord": self.rr_key_word},
+            )
+            return response["DomainRecords"]
         else:
             self.utils.printer(ERROR, "未知的action:", action)
             sys.exit()
 
-        authorization = utils.get_authorization(
-            request,
-            utils.signature_algorithm,
-            hashed_request_payload,
-            self.access_key_id,
-            self.access_key_secret,
-        )
-        request.headers["Authorization"] = authorization
-
-        req = urllib.request.Request(
-            url, data=None, headers=request.headers, method="POST"
-        )
-        with urllib.request.urlopen(
-            req, context=ssl._create_unverified_context()
-        ) as response:
-            response = response.read().decode("utf-8")
-            response = json.loads(response)
-
-        if action == DESCRIBE:
-            return response["DomainRecords"]
+    def _handle_request_with_retry(self, action, data=None, retries=3) -> Any:
+        """
+        请求失败时按带抖动的指数退避重试, 仅重试限流、服务端错误及网络错误
+        更新返回 DomainRecordDuplicate 时远程记录已是该值, 按成功处理
+        :param retries: 最大重试次数
+        """
+        attempt = 0
+        while True:
+            try:
+                return self._handle_request(action, data=data)
+            except AlidnsError as ApiError:
+                if action == UPDATE and ApiError.code == "DomainRecordDuplicate":
+                    # 远程记录已是该值, 如网络错误重试时前一次请求已生效
+                    self.utils.printer(INFO, "远程记录已是该值:", data[1])
+                    return None
+                retryable = (
+                    ApiError.code.startswith("Throttling") or ApiError.status_code >= 500
+                )
+                if not retryable or attempt >= retries:
+                    raise
+                error = f"{ApiError.status_code} {ApiError.code}"
+            except OSError as NetworkError:
+                if attempt >= retries:
+                    raise
+                error = NetworkError
+            delay = min(30, 0.5 * 2**attempt) * random.uniform(0.5, 1.5)
+            attempt += 1
+            self.utils.printer(INFO, f"请求失败, {delay:.2f}s 后第 {attempt} 次重试:", error)
+            time.sleep(delay)
 
     def _describe_record(self) -> Any:
         """
@@ -395,7 +613,7 @@ class AliDDNS:
         :return: dict & bool(false)
         """
         try:
-            response = self._handle_request(DESCRIBE)
+            response = self._handle_request_with_retry(DESCRIBE)
         except Exception as DescribeError:
             self.utils.printer(ERROR, "查询域名主机记录失败:", DescribeError)
             self._send_mail(
@@ -422,7 +640,7 @@ class AliDDNS:
         :return: bool
         """
         try:
-            self._handle_request(UPDATE, data=[record_id, record_value])
+            self._handle_request_with_retry(UPDATE, data=[record_id, record_value])
             self._send_mail(
                 self.send_list,
                 "[{}][PASS]UpdateDomainRecord".format(self.domain_name),
@@ -456,6 +674,10 @@ class AliDDNS:
         :param msg: str
         :return: none
         """
+        import smtplib
+        from email.header import Header
+        from email.mime.text import MIMEText
+
         smtp = smtplib.SMTP_SSL(self.smtp_host, self.smtp_port)
         try:
             smtp.login(self.mail_user, self.mail_passwd)